@@ -0,0 +1,175 @@
+import queue
+
+from PySide6.QtCore import QObject, QRunnable, Qt, QThreadPool, QTimer, Signal, Slot
+from PySide6.QtGui import QImageReader, QPixmap
+
+
+class FrameDecoder(QRunnable):
+    """Decode the upcoming frames of an animation until the frame buffer is full
+
+    The decoder keeps its reader between runs, it is started again each time frames are consumed.
+    """
+
+    def __init__(self, path, frames, scaled_size=None):
+        """
+        Args:
+            path (string): animated image path
+            frames (queue.Queue): bounded buffer of (QImage, delay), None once the animation is over
+            scaled_size (QSize): size the frames are decoded at, the image size if None
+        """
+        super(FrameDecoder, self).__init__()
+        self.path = path
+        self.frames = frames
+        self.scaled_size = scaled_size
+        self.image_reader = None
+        self.count = 0  # frames read in the current loop
+        self.loop = 0
+        self.running = False
+        self.finished = False
+        self.stopped = False
+
+    def open(self):
+        self.image_reader = QImageReader(self.path)
+        if self.scaled_size is not None:
+            image_size = self.image_reader.size()
+            if image_size.isValid():
+                self.image_reader.setScaledSize(image_size.scaled(self.scaled_size, Qt.KeepAspectRatio))
+        self.count = 0
+
+    def run(self):
+        try:
+            while not self.stopped and not self.frames.full():
+                if self.image_reader is None:
+                    self.open()
+                if self.image_reader.canRead():
+                    image = self.image_reader.read()
+                    if not image.isNull():
+                        self.count += 1
+                        self.frames.put((image, max(self.image_reader.nextImageDelay(), 20)))
+                        continue
+
+                # loopCount is the number of repetitions after the first play, -1 to loop forever
+                self.loop += 1
+                loop_count = self.image_reader.loopCount()
+                if self.count <= 1 or (loop_count != -1 and self.loop > loop_count):
+                    self.finished = True
+                    self.frames.put(None)
+                    return
+                self.image_reader = None
+        finally:
+            self.running = False
+
+
+class AnimationPlayer(QObject):
+    """Play an animated image from a small ring buffer of decoded frames
+
+    Unlike QMovie with CacheAll, memory does not grow with the number of frames: only the next
+    `buffer_size` frames are decoded ahead of the displayed one.
+    """
+
+    frame_changed = Signal()
+
+    def __init__(self, path, parent=None, buffer_size=4, scaled_size=None):
+        """
+        Args:
+            path (string): animated image path
+            parent (QObject): parent
+            buffer_size (int): number of frames decoded in advance
+            scaled_size (QSize): size the frames are decoded at, the image size if None
+        """
+        super(AnimationPlayer, self).__init__(parent)
+        self.path = path
+        self.buffer_size = buffer_size
+        self.scaled_size = scaled_size
+        self.pixmap = QPixmap()
+        self.frames = None
+        self.decoder = None
+
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.next_frame)
+
+    def size(self):
+        """return the size of the frames, read from the header"""
+        image_size = QImageReader(self.path).size()
+        if self.scaled_size is not None and image_size.isValid():
+            return image_size.scaled(self.scaled_size, Qt.KeepAspectRatio)
+        return image_size
+
+    def current_pixmap(self):
+        return self.pixmap
+
+    def start(self):
+        """start or resume the animation"""
+        if self.decoder is None:
+            self.frames = queue.Queue(self.buffer_size)
+            self.decoder = FrameDecoder(self.path, self.frames, self.scaled_size)
+            self.decoder.setAutoDelete(False)
+        self.decode()
+        if not self.timer.isActive():
+            self.timer.start(0)
+
+    def pause(self):
+        """pause the animation, the decoded frames are kept"""
+        self.timer.stop()
+
+    def stop(self):
+        """stop the animation and release the decoded frames"""
+        self.timer.stop()
+        if self.decoder is not None:
+            self.decoder.stopped = True
+            # at most one frame is being decoded
+            self.thread_pool.waitForDone()
+            self.decoder = None
+            self.frames = None
+
+    def decode(self):
+        """decode the next frames in background if the decoder is idle"""
+        if not self.decoder.running and not self.decoder.finished:
+            self.decoder.running = True
+            self.thread_pool.start(self.decoder)
+
+    @Slot()
+    def next_frame(self):
+        if self.decoder is None:
+            return
+        try:
+            frame = self.frames.get_nowait()
+        except queue.Empty:
+            if not self.decoder.finished:
+                # the decoder is late, the current frame stays a little longer
+                self.decode()
+                self.timer.start(10)
+            return
+
+        if frame is None:
+            # the last frame stays displayed
+            return
+        self.decode()
+        image, delay = frame
+        self.pixmap = QPixmap.fromImage(image)
+        self.frame_changed.emit()
+        self.timer.start(delay)
+
+
+def frame_count(image_reader):
+    """return the number of frames of an image, the whole file of an animation is parsed
+
+    Args:
+        image_reader (QImageReader): reader of the image
+
+    Returns:
+        int: 1 for a still image, 0 for an animation of unknown length
+    """
+    return image_reader.imageCount() if image_reader.supportsAnimation() else 1
+
+
+def is_animated(image_reader):
+    """return True if an image is played as an animation
+
+    Args:
+        image_reader (QImageReader): reader of the image
+    """
+    return frame_count(image_reader) != 1
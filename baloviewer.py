@@ -1,25 +1,110 @@
+import os
 import sys
+import time
 from optparse import OptionParser
-from single_application import SingleApplication
-from window import Window
-from PySide6.QtCore import QCoreApplication
+from instance_messages import GOTO, LIBRARY, NEXT, OPEN, PREVIOUS, send_messages
+
+SERVER_NAME = 'baloviwer-server-125156dsfdsf'
+
+
+class StartupTimings:
+    """Print the duration of the startup phases on stderr"""
+
+    def __init__(self, enabled, start):
+        self.enabled = enabled
+        self.start = self.last = start
+        self.phases = set()
+
+    def mark(self, phase):
+        """print the time since the previous phase and since the start, once per phase"""
+        if not self.enabled or phase in self.phases:
+            return
+        self.phases.add(phase)
+        now = time.perf_counter()
+        print('{0:<24}{1:8.1f} ms{2:8.1f} ms'.format(phase, (now - self.last) * 1000, (now - self.start) * 1000),
+              file=sys.stderr)
+        self.last = now
+
+
+def parse_command_line(argv):
+    """return the commands of the command line, as messages of the single application, and the options
+
+    Args:
+        argv (list): command line arguments, without the program name
+    """
+    parser = OptionParser(usage='%prog [options] [file...]',
+                          description='A single file is displayed with the images of its folder, several files are '
+                                      'browsed as the image list.')
+    parser.add_option("-f", "--file", dest="filename", help="open a file")
+    parser.add_option("-l", "--library", dest="library", metavar="DIRECTORY",
+                      help="browse the images of a directory and of its subdirectories")
+    parser.add_option("-n", "--next", action="store_true", dest="next", help="display the next image")
+    parser.add_option("-p", "--previous", action="store_true", dest="previous", help="display the previous image")
+    parser.add_option("-g", "--goto", type="int", dest="goto", metavar="NUMBER",
+                      help="display the image at a position in the list, from 1")
+    parser.add_option("--timings", action="store_true", dest="timings", help="print the startup phase timings")
+    parser.add_option("--profile", dest="profile", metavar="FILE", default=os.environ.get('BALOVIEWER_PROFILE'),
+                      help="append the timings of the displays and thumbnails to FILE, as JSON lines "
+                           "(default: $BALOVIEWER_PROFILE)")
+    (options, args) = parser.parse_args(argv)
+
+    messages = []
+    # the running instance has its own working directory
+    paths = [os.path.abspath(path) for path in [options.filename] + args if path and os.path.isfile(path)]
+    if paths:
+        messages.append({'command': OPEN, 'paths': paths})
+    if options.library and os.path.isdir(options.library):
+        messages.append({'command': LIBRARY, 'path': os.path.abspath(options.library)})
+    if options.goto is not None:
+        messages.append({'command': GOTO, 'index': options.goto - 1})
+    if options.next:
+        messages.append({'command': NEXT})
+    if options.previous:
+        messages.append({'command': PREVIOUS})
+    return messages, options
+
 
 if __name__ == '__main__':
+    start = time.perf_counter()
+    messages, options = parse_command_line(sys.argv[1:])
+    timings = StartupTimings(options.timings, start)
+
+    # a running instance is handed the command line before Qt and the GUI modules are loaded
+    if send_messages(SERVER_NAME, messages):
+        timings.mark('sent to the instance')
+        sys.exit(0)
+    timings.mark('command line')
+
+    from PySide6.QtCore import QCoreApplication, QTimer
+    from profiler import profiler
+    from single_application import SingleApplication
+    from window import Window
+    timings.mark('imports')
+
     QCoreApplication.setApplicationName('Balob')
     QCoreApplication.setApplicationName('Balobviewer')
 
-    appGuid = 'baloviwer-server-125156dsfdsf'
-    app = SingleApplication(appGuid, sys.argv)
+    app = SingleApplication(SERVER_NAME, sys.argv)
     if app.get_is_running():
-        parser = OptionParser()
-        parser.add_option("-f", "--file", dest="filename", help="open a file")
-        (options, args) = parser.parse_args()
-        parser_file = options.filename
-        if parser_file is not None:
-            app.send_message(parser_file)
+        # an instance started meanwhile
+        for message in messages:
+            app.send_message(message)
         sys.exit(0)
+    timings.mark('application')
+
+    if options.profile:
+        try:
+            profiler.enable(options.profile)
+        except OSError as error:
+            print('cannot open the profile {0}: {1}'.format(options.profile, error), file=sys.stderr)
 
     window = Window()
+    timings.mark('window')
+    # the marks are printed once the event loop has painted the window
+    window.image_shown.connect(lambda: QTimer.singleShot(0, lambda: timings.mark('first image painted')))
+    window.images_listed.connect(lambda: timings.mark('folder listed'))
     window.showMaximized()
     app.set_activation_window(window)
+    window.run_messages(messages)
+    timings.mark('image requested')
     sys.exit(app.exec_())
@@ -0,0 +1,377 @@
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import SUPPRESS_HELP, OptionParser
+
+# name -> (kind, number of files, width, height), and the reduced sizes of --quick
+CORPORA = {
+    'small_jpegs': ('jpeg', 2000, 800, 600),
+    'huge_pngs': ('png', 3, 8000, 6000),
+    'animated_gifs': ('gif', 20, 320, 240),
+    'large_folder': ('copies', 50000, 160, 120),
+}
+QUICK_CORPORA = {
+    'small_jpegs': ('jpeg', 200, 800, 600),
+    'huge_pngs': ('png', 2, 4000, 3000),
+    'animated_gifs': ('gif', 5, 320, 240),
+    'large_folder': ('copies', 5000, 160, 120),
+}
+GIF_FRAMES = 30
+
+
+def lzw_literals(indexes):
+    """return the GIF image data of palette indexes, as LZW literal codes only
+
+    A clear code is written every 254 codes, before the decoder grows the codes past 9 bits.
+    """
+    bits = 0
+    count = 0
+    stream = bytearray()
+    codes = [256]  # clear
+    for start in range(0, len(indexes), 254):
+        codes.extend(indexes[start:start + 254])
+        codes.append(256)
+    codes.append(257)  # end of information
+    for code in codes:
+        bits |= code << count
+        count += 9
+        while count >= 8:
+            stream.append(bits & 0xff)
+            bits >>= 8
+            count -= 8
+    if count:
+        stream.append(bits & 0xff)
+
+    data = [b'\x08']
+    for start in range(0, len(stream), 255):
+        block = stream[start:start + 255]
+        data.append(bytes((len(block),)) + block)
+    data.append(b'\x00')
+    return b''.join(data)
+
+
+def gif_bytes(frames, width, height, delay=4):
+    """return an animated GIF looping forever, Qt has no GIF writer
+
+    Args:
+        frames (list): image data of each frame, see lzw_literals
+        width (int): width
+        height (int): height
+        delay (int): delay between frames in 1/100 s
+    """
+    palette = b''.join(bytes(((index & 0xe0), (index & 0x1c) << 3, (index & 0x03) << 6)) for index in range(256))
+    data = [b'GIF89a', struct.pack('<HHBBB', width, height, 0xf7, 0, 0), palette,
+            b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00']
+    for frame in frames:
+        data.append(struct.pack('<BBBBHBB', 0x21, 0xf9, 4, 0, delay, 0, 0))
+        data.append(struct.pack('<BHHHHB', 0x2c, 0, 0, width, height, 0))
+        data.append(frame)
+    data.append(b'\x3b')
+    return b''.join(data)
+
+
+def synthetic_image(width, height, seed):
+    """return an image of gradients and random rectangles, compressed about like a photo"""
+    from PySide6.QtGui import QColor, QImage, QLinearGradient, QPainter
+
+    generator = random.Random(seed)
+    image = QImage(width, height, QImage.Format_RGB32)
+    painter = QPainter(image)
+    gradient = QLinearGradient(0, 0, width, height)
+    gradient.setColorAt(0, QColor(*(generator.randrange(256) for _ in range(3))))
+    gradient.setColorAt(1, QColor(*(generator.randrange(256) for _ in range(3))))
+    painter.fillRect(image.rect(), gradient)
+    for _ in range(40):
+        painter.fillRect(generator.randrange(width), generator.randrange(height), generator.randrange(1, width // 3),
+                         generator.randrange(1, height // 3), QColor(*(generator.randrange(256) for _ in range(4))))
+    painter.end()
+    return image
+
+
+def make_corpus(directory, kind, count, width, height):
+    """write the files of a corpus in an empty directory"""
+    os.makedirs(directory, exist_ok=True)
+    if kind == 'gif':
+        # a stripe pattern scrolling, the frames are encoded once and shared by the files
+        frames = []
+        for frame in range(GIF_FRAMES):
+            row = bytes((x // 4 + frame * 8) & 0xff for x in range(width))
+            frames.append(lzw_literals(row * height))
+        for number in range(count):
+            with open(os.path.join(directory, 'anim_{0:04d}.gif'.format(number)), 'wb') as file:
+                file.write(gif_bytes(frames[number % GIF_FRAMES:] + frames[:number % GIF_FRAMES], width, height))
+    elif kind == 'copies':
+        # many files of a few distinct contents, written fast
+        sources = []
+        for number in range(16):
+            path = os.path.join(directory, 'img_{0:06d}.jpg'.format(number))
+            synthetic_image(width, height, number).save(path, 'JPEG', 85)
+            with open(path, 'rb') as file:
+                sources.append(file.read())
+        for number in range(16, count):
+            with open(os.path.join(directory, 'img_{0:06d}.jpg'.format(number)), 'wb') as file:
+                file.write(sources[number % 16])
+    else:
+        extension, image_format = ('jpg', 'JPEG') if kind == 'jpeg' else ('png', 'PNG')
+        for number in range(count):
+            path = os.path.join(directory, 'img_{0:04d}.{1}'.format(number, extension))
+            synthetic_image(width, height, number).save(path, image_format, 85 if kind == 'jpeg' else -1)
+
+
+def corpus_size(directory):
+    names = os.listdir(directory)
+    return len(names), sum(os.path.getsize(os.path.join(directory, name)) for name in names)
+
+
+def peak_rss_mb():
+    """return the peak resident memory of this process in MB, None if it cannot be read"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kB elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+
+def run_corpus(directory, steps):
+    """time the viewer on a corpus, in a process of its own
+
+    Args:
+        directory (string): corpus directory
+        steps (int): number of next_image calls timed
+
+    Returns:
+        dict: metric -> value, durations in ms
+    """
+    from PySide6.QtCore import QCoreApplication, QEventLoop, QTimer
+    from PySide6.QtWidgets import QAbstractItemView, QApplication
+
+    QCoreApplication.setApplicationName('BalobviewerBenchmark')
+    app = QApplication([sys.argv[0]])
+    from window import Window
+
+    window = Window()
+    window.resize(1280, 800)
+    window.show()
+    window.dock_widget.show()
+    gallery = window.image_gallery
+    model = gallery.gallery_model
+    shown = []  # (path, time) of the images painted, path is None for a preview
+
+    window.image_shown.connect(
+        lambda path: shown.append((None if window.preview == path else path, time.perf_counter())))
+
+    def wait_until(condition, timeout=120.0):
+        """run the event loop until condition() is true, return the elapsed ms"""
+        start = time.perf_counter()
+        loop = QEventLoop()
+        timer = QTimer()
+        timer.setInterval(1)
+        timer.timeout.connect(lambda: (condition() or time.perf_counter() - start > timeout) and loop.quit())
+        if not condition():
+            timer.start()
+            loop.exec()
+            timer.stop()
+        if not condition():
+            raise TimeoutError('benchmark step over {0} s'.format(timeout))
+        return (time.perf_counter() - start) * 1000
+
+    def thumbnails_loaded():
+        return all(model.images[row] in model.thumbnails for row in gallery.visible_rows())
+
+    def displayed():
+        return bool(shown) and shown[-1][0] == window.images[window.index]
+
+    results = {}
+    files = sorted(os.path.join(directory, name) for name in os.listdir(directory))
+
+    # listing, the folder scan is waited for
+    start = time.perf_counter()
+    window.create_images(files[0], wait=True)
+    results['create_images_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    results['images'] = len(window.images)
+
+    # first display, then images spread over the folder, each decoded again
+    first_paints = []
+    full_paints = []
+    for index in sorted({len(window.images) * number // 5 for number in range(5)}):
+        window.image_loader.clear()
+        window.image_loader.cache.clear()
+        del shown[:]
+        window.index = index
+        start = time.perf_counter()
+        window.display_image()
+        full_paints.append(wait_until(displayed))
+        first_paints.append((shown[0][1] - start) * 1000)
+        if index == 0:
+            results['first_display_ms'] = round(full_paints[-1], 1)
+    results['display_first_paint_ms'] = round(median(first_paints), 1)
+    results['display_ms'] = round(median(full_paints), 1)
+    results['display_max_ms'] = round(max(full_paints), 1)
+
+    # gallery: the first screen of thumbnails, then page after page
+    window.index = 0
+    window.display_image()
+    gallery.scrollToTop()
+    results['gallery_first_screen_ms'] = round(wait_until(thumbnails_loaded), 1)
+    rows = min(len(window.images), 1000)
+    start = time.perf_counter()
+    row = 0
+    while row < rows:
+        gallery.scrollTo(model.index(row), QAbstractItemView.PositionAtTop)
+        wait_until(thumbnails_loaded)
+        row = max(row + 1, gallery.visible_rows()[-1] + 1)
+    elapsed = time.perf_counter() - start
+    results['gallery_thumbnails_per_s'] = round(rows / elapsed, 1) if elapsed else None
+
+    # navigation, each image is waited for
+    window.index = 0
+    window.display_image()
+    wait_until(displayed)
+    steps = min(steps, len(window.images) - 1)
+    start = time.perf_counter()
+    for _ in range(steps):
+        window.next_image()
+        wait_until(displayed)
+    elapsed = time.perf_counter() - start
+    results['next_image_per_s'] = round(steps / elapsed, 1) if steps and elapsed else None
+
+    results['peak_rss_mb'] = peak_rss_mb()
+    window.close()
+    app.processEvents()
+    return results
+
+
+def last_json(output):
+    """return the last JSON object printed by a corpus process, None if there is none
+
+    Args:
+        output (bytes): standard output of the process
+    """
+    for line in reversed(output.decode('utf-8', 'replace').splitlines()):
+        try:
+            results = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(results, dict):
+            return results
+    return None
+
+
+def compare(previous, current):
+    """print the change of each metric from a previous run"""
+    for corpus, metrics in current['results'].items():
+        for metric, value in metrics.items():
+            old = previous.get('results', {}).get(corpus, {}).get(metric)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                change = (value - old) * 100 / old
+                print('{0:<16}{1:<28}{2:>10}{3:>10}{4:>+9.1f}%'.format(corpus, metric, old, value, change))
+
+
+def main():
+    parser = OptionParser(usage='QT_QPA_PLATFORM=offscreen %prog [options] [corpus...]',
+                          description='Time listing, thumbnailing, display and navigation on synthetic corpora: '
+                                      + ', '.join(CORPORA) + '. Results are written as JSON.')
+    parser.add_option('-d', '--corpus-dir', dest='corpus_dir',
+                      help='directory the corpora are generated in and reused from, temporary by default')
+    parser.add_option('-o', '--output', dest='output', help='JSON file to write, stdout by default')
+    parser.add_option('-c', '--compare', dest='compare', metavar='FILE', help='print the changes from a previous run')
+    parser.add_option('-q', '--quick', action='store_true', dest='quick', help='smaller corpora')
+    parser.add_option('-s', '--steps', type='int', dest='steps', default=50, help='next_image calls timed')
+    parser.add_option('--run', dest='run', help=SUPPRESS_HELP)
+    (options, args) = parser.parse_args()
+
+    if options.run:
+        # child process: one corpus, caches and settings of its own
+        print(json.dumps(run_corpus(options.run, options.steps)), flush=True)
+        return
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    corpora = QUICK_CORPORA if options.quick else CORPORA
+    names = args or list(corpora)
+    for name in names:
+        if name not in corpora:
+            parser.error('unknown corpus {0}'.format(name))
+
+    from PySide6 import __version__ as pyside_version
+    from PySide6.QtCore import qVersion
+    from PySide6.QtGui import QGuiApplication
+    # the image plugins are loaded by an application
+    app = QGuiApplication([sys.argv[0]])
+
+    corpus_dir = options.corpus_dir or tempfile.mkdtemp(prefix='baloviewer-benchmark-')
+    report = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pyside': pyside_version,
+        'qt': qVersion(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'quick': bool(options.quick),
+        'corpora': {},
+        'results': {},
+        'failed': {},  # corpus -> exit status of its process
+    }
+    try:
+        for name in names:
+            kind, count, width, height = corpora[name]
+            directory = os.path.join(corpus_dir, '{0}-{1}-{2}x{3}'.format(name, count, width, height))
+            if not os.path.isdir(directory):
+                print('generating {0}'.format(name), file=sys.stderr)
+                make_corpus(directory + '.tmp', kind, count, width, height)
+                os.replace(directory + '.tmp', directory)
+            files, size = corpus_size(directory)
+            report['corpora'][name] = {'files': files, 'bytes': size, 'width': width, 'height': height}
+
+            print('running {0}'.format(name), file=sys.stderr)
+            home = tempfile.mkdtemp(prefix='baloviewer-benchmark-home-')
+            try:
+                # empty thumbnail cache and default settings
+                env = dict(os.environ, XDG_CACHE_HOME=os.path.join(home, 'cache'),
+                           XDG_CONFIG_HOME=os.path.join(home, 'config'))
+                child = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', directory,
+                                        '--steps', str(options.steps)], env=env,
+                                       stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+            finally:
+                shutil.rmtree(home, ignore_errors=True)
+            results = last_json(child.stdout)
+            if results is not None:
+                report['results'][name] = results
+            if child.returncode:
+                # the metrics printed before a crash at exit are kept, the other corpora are still run
+                report['failed'][name] = child.returncode
+                print('{0} exited with status {1}'.format(name, child.returncode), file=sys.stderr)
+    finally:
+        if not options.corpus_dir:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    if options.compare:
+        with open(options.compare, encoding='utf-8') as file:
+            compare(json.load(file), report)
+    app.quit()
+    if report['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
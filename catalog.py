@@ -0,0 +1,254 @@
+import os
+import sqlite3
+import threading
+
+from collections import namedtuple
+from PySide6.QtCore import QObject, QRunnable, QStandardPaths, QThreadPool, Signal, Slot
+from PySide6.QtGui import QImageReader
+from animation_player import frame_count
+from exif import read_exif
+from sort_order import natural_key
+
+# metadata of an image file, width, height and date are None when they cannot be read
+FileInfo = namedtuple('FileInfo', 'mtime_ns size width height frames date')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS folders (
+    folder TEXT PRIMARY KEY,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    mtime_ns INTEGER,
+    size INTEGER,
+    width INTEGER,
+    height INTEGER,
+    frames INTEGER,
+    date TEXT
+);
+CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+'''
+
+
+def read_metadata(path, stat):
+    """read the metadata of an image from its header, the pixels are not decoded
+
+    Args:
+        path (string): image path
+        stat (os.stat_result): stat of the file
+
+    Returns:
+        FileInfo: metadata, frames is 1 for a still image and 0 for an animation of unknown length
+    """
+    image_reader = QImageReader(path)
+    size = image_reader.size()
+    frames = frame_count(image_reader)
+    exif = read_exif(path)
+    return FileInfo(stat.st_mtime_ns, stat.st_size, size.width() if size.isValid() else None,
+                    size.height() if size.isValid() else None, frames, exif.date_time_original if exif else None)
+
+
+class Catalog:
+    """Folder listings and image metadata persisted in a SQLite database
+
+    A folder listing is valid while the modification time of the folder does not change, the
+    metadata of a file while its modification time and size do not change. As the racily clean
+    entries of git, a folder listed within RACY_NS of its modification time is listed again next
+    time: a file created in the same timestamp tick would not change the modification time. Each thread opens its
+    own connection, the database is in WAL mode so the readers do not wait for the writer.
+
+    The catalog is a cache: when the database cannot be used, the methods return nothing and the
+    callers list and read the files.
+    """
+
+    RACY_NS = 2 * 10 ** 9  # coarsest timestamps, FAT has 2 s
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(QStandardPaths.writableLocation(QStandardPaths.CacheLocation), 'catalog.sqlite')
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        """return the connection of the calling thread, the database is created on first use"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self.local.connection = connection
+        return connection
+
+    def listing(self, folder):
+        """return the stored images of a folder if the folder has not changed since they were listed
+
+        Args:
+            folder (string): folder path
+
+        Returns:
+            list: list of image path in natural order, None if the folder must be listed
+        """
+        try:
+            mtime_ns = os.stat(folder or '.').st_mtime_ns
+            connection = self.connection()
+            row = connection.execute('SELECT mtime_ns FROM folders WHERE folder = ?', (folder,)).fetchone()
+            if row is None or row[0] != mtime_ns:
+                return None
+            images = [path for path, in connection.execute('SELECT path FROM files WHERE folder = ?', (folder,))]
+        except (OSError, sqlite3.Error, UnicodeEncodeError):
+            # a folder whose path is not valid UTF-8 is never stored
+            return None
+        images.sort(key=natural_key)
+        return images
+
+    def entries(self, folder):
+        """return the stored metadata of the images of a folder
+
+        Args:
+            folder (string): folder path
+
+        Returns:
+            dict: path -> FileInfo, mtime_ns is None for a file listed but not read yet
+        """
+        try:
+            rows = self.connection().execute('SELECT path, mtime_ns, size, width, height, frames, date FROM files '
+                                             'WHERE folder = ?', (folder,))
+            return {row[0]: FileInfo(*row[1:]) for row in rows}
+        except (OSError, sqlite3.Error, UnicodeEncodeError):
+            return {}
+
+    def save_listing(self, folder, mtime_ns, images, listed_ns):
+        """store the images of a folder, the files no longer listed are forgotten
+
+        Args:
+            folder (string): folder path
+            mtime_ns (int): modification time of the folder before it was listed
+            images (list): list of image path
+            listed_ns (int): time at which mtime_ns was read, in ns since the epoch
+        """
+        if listed_ns - mtime_ns < self.RACY_NS:
+            # the files are stored for their metadata, the listing is not reused
+            mtime_ns = None
+        try:
+            connection = self.connection()
+            with connection:
+                stored = {path for path, in connection.execute('SELECT path FROM files WHERE folder = ?', (folder,))}
+                listed = set(images)
+                connection.executemany('DELETE FROM files WHERE path = ?', ((path,) for path in stored - listed))
+                connection.executemany('INSERT OR IGNORE INTO files (path, folder) VALUES (?, ?)',
+                                       ((path, folder) for path in listed - stored))
+                connection.execute('INSERT OR REPLACE INTO folders (folder, mtime_ns) VALUES (?, ?)',
+                                   (folder, mtime_ns))
+        except (OSError, sqlite3.Error, UnicodeEncodeError):
+            # paths that are not valid UTF-8 cannot be stored, the folder is listed each time
+            pass
+
+    def save_metadata(self, metadata):
+        """store the metadata of listed files
+
+        Args:
+            metadata (dict): path -> FileInfo
+        """
+        try:
+            connection = self.connection()
+            with connection:
+                connection.executemany('UPDATE files SET mtime_ns = ?, size = ?, width = ?, height = ?, frames = ?, '
+                                       'date = ? WHERE path = ?', (info + (path,) for path, info in metadata.items()))
+        except (OSError, sqlite3.Error, UnicodeEncodeError):
+            pass
+
+
+class CatalogSignals(QObject):
+    updated = Signal(int, object)
+
+
+class CatalogTask(QRunnable):
+    BATCH_SIZE = 256
+
+    def __init__(self, catalog, result, generation, signals):
+        super(CatalogTask, self).__init__()
+        self.catalog = catalog
+        self.result = result
+        self.generation = generation
+        self.signals = signals
+        self.cancelled = False
+
+    def run(self):
+        """deliver the stored metadata, then read the files that are new or changed since they were stored"""
+        result = self.result
+        entries = self.catalog.entries(result.directory)
+        if result.mtime_ns is not None:
+            self.catalog.save_listing(result.directory, result.mtime_ns, result.images, result.listed_ns)
+        stored = {path: entries[path] for path in result.images if path in entries and entries[path].mtime_ns}
+        if stored:
+            self.signals.updated.emit(self.generation, stored)
+
+        changed = {}
+        for path in result.images:
+            if self.cancelled:
+                return
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            info = stored.get(path)
+            if info and info.mtime_ns == stat.st_mtime_ns and info.size == stat.st_size:
+                continue
+            changed[path] = read_metadata(path, stat)
+            if len(changed) == self.BATCH_SIZE:
+                self.save(changed)
+                changed = {}
+        if changed:
+            self.save(changed)
+
+    def save(self, changed):
+        self.catalog.save_metadata(changed)
+        self.signals.updated.emit(self.generation, changed)
+
+
+class MetadataScanner(QObject):
+    """Keep the catalog of the listed folder up to date in background
+
+    The stored metadata is delivered at once, the files changed since then are read and delivered by
+    batches. Only the updates of the last folder refreshed are delivered.
+    """
+
+    updated = Signal(object)  # path -> FileInfo
+
+    def __init__(self, catalog, parent=None):
+        super(MetadataScanner, self).__init__(parent)
+        self.catalog = catalog
+        self.task = None
+        self.generation = 0
+
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+
+        self.signals = CatalogSignals(self)
+        self.signals.updated.connect(self.on_updated)
+
+    def refresh(self, result):
+        """update the catalog with a folder listing, the previous refresh is cancelled
+
+        Args:
+            result (ScanResult): images of the folder
+        """
+        self.cancel()
+        self.task = CatalogTask(self.catalog, result, self.generation, self.signals)
+        self.task.setAutoDelete(False)
+        self.thread_pool.start(self.task)
+
+    def cancel(self):
+        self.generation += 1
+        if self.task is not None:
+            self.task.cancelled = True
+            self.thread_pool.tryTake(self.task)
+            self.task = None
+
+    @Slot(int, object)
+    def on_updated(self, generation, metadata):
+        if generation == self.generation:
+            self.updated.emit(metadata)
@@ -0,0 +1,264 @@
+import functools
+import os
+import time
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal, Slot
+from PySide6.QtGui import QImageReader
+from sort_order import directory_key, natural_key
+
+
+@functools.lru_cache(maxsize=None)
+def image_extensions():
+    """return the lower-cased extensions of the formats Qt can read, as '.jpg'
+
+    The image plugins are only enumerated on the first call.
+    """
+    return frozenset('.' + format.data().decode('utf-8').lower() for format in QImageReader.supportedImageFormats())
+
+
+class ScanResult:
+    def __init__(self, images, elapsed, directory=None, mtime_ns=None, metadata=None, listed_ns=None):
+        """
+        Args:
+            images (list): list of image path in natural order
+            elapsed (float): scan duration in seconds
+            directory (string): directory scanned
+            mtime_ns (int): modification time of the directory before it was scanned, None if the
+                listing comes from the catalog
+            metadata (dict): path -> FileInfo stored in the catalog, the files changed since are read later
+            listed_ns (int): time at which mtime_ns was read, in ns since the epoch
+        """
+        self.images = images
+        self.indexes = {path: index for index, path in enumerate(images)}
+        self.elapsed = elapsed
+        self.directory = directory
+        self.mtime_ns = mtime_ns
+        self.metadata = metadata or {}
+        self.listed_ns = listed_ns
+
+
+def scan_directory(directory, extensions, catalog=None):
+    """list the images of a directory in a single pass
+
+    Hidden files are skipped, as glob did.
+
+    Args:
+        directory (string): directory to scan
+        extensions (set): lower-cased extensions to keep, as '.jpg'
+        catalog (Catalog): catalog whose listing is used if the directory has not changed since, and
+            whose metadata is returned with the images
+
+    Returns:
+        ScanResult: images and path -> index map
+    """
+    start = time.perf_counter()
+    metadata = {}
+    if catalog is not None:
+        # the images can be sorted by date or size without reading the files again
+        metadata = {path: info for path, info in catalog.entries(directory).items() if info.mtime_ns is not None}
+        images = catalog.listing(directory)
+        if images is not None:
+            return ScanResult(images, time.perf_counter() - start, directory, metadata=metadata)
+    images = []
+    # the clock is read before the folder, a file added in the same timestamp tick leaves the mtime unchanged
+    listed_ns = time.time_ns()
+    try:
+        # taken first, a file added while scanning makes the listing stale
+        mtime_ns = os.stat(directory or '.').st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    try:
+        with os.scandir(directory or '.') as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith('.') or os.path.splitext(name)[1].lower() not in extensions:
+                    continue
+                try:
+                    if entry.is_file():
+                        images.append(os.path.join(directory, name))
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    # sorted in the worker thread, the window keeps this order and places the new files by binary search
+    images.sort(key=natural_key)
+    return ScanResult(images, time.perf_counter() - start, directory, mtime_ns, metadata, listed_ns)
+
+
+class ScanSignals(QObject):
+    scanned = Signal(int, object)
+
+
+class ScanTask(QRunnable):
+    def __init__(self, directory, extensions, generation, signals, catalog=None):
+        super(ScanTask, self).__init__()
+        self.directory = directory
+        self.extensions = extensions
+        self.generation = generation
+        self.signals = signals
+        self.catalog = catalog
+
+    def run(self):
+        self.signals.scanned.emit(self.generation, scan_directory(self.directory, self.extensions, self.catalog))
+
+
+class DirectoryScanner(QObject):
+    """List directories in a worker thread, only the result of the last scan started is delivered"""
+
+    scanned = Signal(object)  # ScanResult
+
+    def __init__(self, parent=None):
+        super(DirectoryScanner, self).__init__(parent)
+        self.generation = 0
+        self.scanning = False
+
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+
+        self.signals = ScanSignals(self)
+        self.signals.scanned.connect(self.on_scanned)
+
+    def scan(self, directory, extensions, catalog=None):
+        """list the images of a directory in background, the previous scan is cancelled
+
+        Args:
+            directory (string): directory to scan
+            extensions (set): lower-cased extensions to keep, as '.jpg'
+            catalog (Catalog): catalog whose listing is used if the directory has not changed since
+        """
+        self.cancel()
+        self.scanning = True
+        self.thread_pool.start(ScanTask(directory, extensions, self.generation, self.signals, catalog))
+
+    def cancel(self):
+        self.generation += 1
+        self.scanning = False
+        self.thread_pool.clear()
+
+    @Slot(int, object)
+    def on_scanned(self, generation, result):
+        if generation == self.generation:
+            self.scanning = False
+            self.scanned.emit(result)
+
+
+class TreeScanSignals(QObject):
+    found = Signal(int, object)
+    finished = Signal(int, object, float)
+
+
+class TreeScanTask(QRunnable):
+    BATCH_SIZE = 5000
+    BATCH_INTERVAL = 0.2  # seconds
+
+    def __init__(self, directory, extensions, generation, signals):
+        super(TreeScanTask, self).__init__()
+        self.directory = directory
+        self.extensions = extensions
+        self.generation = generation
+        self.signals = signals
+        self.cancelled = False
+
+    def run(self):
+        """walk the tree depth-first, the files of a directory before its subdirectories, in natural order
+
+        The first images are sent at once, then by batches. Symbolic links to directories are not
+        followed, hidden files and directories are skipped.
+        """
+        start = time.perf_counter()
+        images = []
+        sent = 0
+        last_sent = start
+        stack = [self.directory]
+        while stack:
+            files = []
+            subdirectories = []
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if self.cancelled:
+                            return
+                        name = entry.name
+                        if name.startswith('.'):
+                            continue
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirectories.append(entry.path)
+                            elif os.path.splitext(name)[1].lower() in self.extensions and entry.is_file():
+                                files.append(entry.path)
+                        except OSError:
+                            pass
+            except OSError:
+                continue
+            files.sort(key=natural_key)
+            images += files
+            # popped in natural order
+            subdirectories.sort(key=directory_key, reverse=True)
+            stack += subdirectories
+
+            now = time.perf_counter()
+            if len(images) > sent and (not sent or len(images) - sent >= self.BATCH_SIZE
+                                       or now - last_sent >= self.BATCH_INTERVAL):
+                self.signals.found.emit(self.generation, images[sent:])
+                sent = len(images)
+                last_sent = now
+        if len(images) > sent:
+            self.signals.found.emit(self.generation, images[sent:])
+        self.signals.finished.emit(self.generation, images, time.perf_counter() - start)
+
+
+class TreeScanner(QObject):
+    """List the images of a directory tree in a worker thread
+
+    The images are delivered by batches while the tree is walked, in natural order, so that the
+    first ones can be displayed at once. The scan can be cancelled at any time.
+    """
+
+    found = Signal(object)  # list of image path, after the ones found before
+    finished = Signal(object, float)  # all the images in natural order, duration of the walk
+
+    def __init__(self, parent=None):
+        super(TreeScanner, self).__init__(parent)
+        self.task = None
+        self.generation = 0
+        self.scanning = False
+
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+
+        self.signals = TreeScanSignals(self)
+        self.signals.found.connect(self.on_found)
+        self.signals.finished.connect(self.on_finished)
+
+    def scan(self, directory, extensions):
+        """list the images of a tree in background, the previous scan is cancelled
+
+        Args:
+            directory (string): root of the tree
+            extensions (set): lower-cased extensions to keep, as '.jpg'
+        """
+        self.cancel()
+        self.scanning = True
+        self.task = TreeScanTask(directory, extensions, self.generation, self.signals)
+        self.task.setAutoDelete(False)
+        self.thread_pool.start(self.task)
+
+    def cancel(self):
+        self.generation += 1
+        self.scanning = False
+        if self.task is not None:
+            self.task.cancelled = True
+            self.thread_pool.tryTake(self.task)
+            self.task = None
+
+    @Slot(int, object)
+    def on_found(self, generation, images):
+        if generation == self.generation:
+            self.found.emit(images)
+
+    @Slot(int, object, float)
+    def on_finished(self, generation, images, elapsed):
+        if generation == self.generation:
+            self.scanning = False
+            self.task = None
+            self.finished.emit(images, elapsed)
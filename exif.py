@@ -0,0 +1,251 @@
+import os
+import shutil
+import struct
+import tempfile
+
+
+# tags
+ORIENTATION = 0x0112
+DATE_TIME = 0x0132
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+JPEG_INTERCHANGE_FORMAT = 0x0201
+JPEG_INTERCHANGE_FORMAT_LENGTH = 0x0202
+
+# size in bytes of the TIFF field types
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+# orientation -> (m11, m12, m21, m22) of the QTransform displaying the stored pixels upright
+ORIENTATION_MATRICES = {
+    1: (1, 0, 0, 1),
+    2: (-1, 0, 0, 1),  # mirrored
+    3: (-1, 0, 0, -1),  # rotated 180
+    4: (1, 0, 0, -1),  # flipped
+    5: (0, 1, 1, 0),  # mirrored and rotated 270
+    6: (0, 1, -1, 0),  # rotated 90
+    7: (0, -1, -1, 0),  # mirrored and rotated 90
+    8: (0, -1, 1, 0),  # rotated 270
+}
+MATRIX_ORIENTATIONS = {matrix: orientation for orientation, matrix in ORIENTATION_MATRICES.items()}
+
+
+class Exif:
+    """Minimal reader of the Exif block of a JPEG file
+
+    Only the tags needed by the viewer are decoded: orientation, capture date and the embedded
+    thumbnail. No pixel data is read.
+    """
+
+    def __init__(self, data, offset):
+        """
+        Args:
+            data (bytes): TIFF structure of the APP1 Exif segment
+            offset (int): position of the TIFF structure in the file
+        """
+        self.data = data
+        self.offset = offset
+        self.byte_order = '<' if data[:2] == b'II' else '>'
+        self.ifd0 = {}
+        self.ifd1 = {}
+        self.exif_ifd = {}
+
+        ifd0_offset = self.unpack('I', 4)
+        self.ifd0, ifd1_offset = self.read_ifd(ifd0_offset)
+        if ifd1_offset:
+            self.ifd1, _ = self.read_ifd(ifd1_offset)
+        if EXIF_IFD in self.ifd0:
+            self.exif_ifd, _ = self.read_ifd(self.value(self.ifd0, EXIF_IFD))
+
+    def unpack(self, fmt, position):
+        return struct.unpack_from(self.byte_order + fmt, self.data, position)[0]
+
+    def read_ifd(self, position):
+        """read an image file directory
+
+        Args:
+            position (int): offset of the directory in the TIFF structure
+
+        Returns:
+            tuple: (dict tag -> (type, count, position of the entry), offset of the next directory)
+        """
+        entries = {}
+        if position <= 0 or position + 2 > len(self.data):
+            return entries, 0
+        count = self.unpack('H', position)
+        for i in range(count):
+            entry = position + 2 + i * 12
+            if entry + 12 > len(self.data):
+                return entries, 0
+            tag = self.unpack('H', entry)
+            entries[tag] = (self.unpack('H', entry + 2), self.unpack('I', entry + 4), entry)
+        next_position = position + 2 + count * 12
+        next_ifd = self.unpack('I', next_position) if next_position + 4 <= len(self.data) else 0
+        return entries, next_ifd
+
+    def value_position(self, entries, tag):
+        """return the position of the value of a tag, values of 4 bytes or less are in the entry"""
+        field_type, count, entry = entries[tag]
+        if TYPE_SIZES.get(field_type, 1) * count <= 4:
+            return entry + 8
+        return self.unpack('I', entry + 8)
+
+    def value(self, entries, tag):
+        """return the value of a SHORT, LONG or ASCII tag, None if it is missing or invalid"""
+        if tag not in entries:
+            return None
+        field_type, count, _ = entries[tag]
+        position = self.value_position(entries, tag)
+        try:
+            if field_type == 3:
+                return self.unpack('H', position)
+            elif field_type == 4:
+                return self.unpack('I', position)
+            elif field_type == 2:
+                return self.data[position:position + count].split(b'\x00', 1)[0].decode('ascii', 'replace')
+        except struct.error:
+            return None
+        return None
+
+    @property
+    def orientation(self):
+        """Exif orientation from 1 to 8, 1 if it is missing"""
+        orientation = self.value(self.ifd0, ORIENTATION)
+        return orientation if orientation in range(1, 9) else 1
+
+    @property
+    def date_time_original(self):
+        """capture date as 'YYYY:MM:DD HH:MM:SS' or None"""
+        return self.value(self.exif_ifd, DATE_TIME_ORIGINAL) or self.value(self.ifd0, DATE_TIME)
+
+    @property
+    def thumbnail(self):
+        """embedded JPEG thumbnail as bytes or None"""
+        start = self.value(self.ifd1, JPEG_INTERCHANGE_FORMAT)
+        length = self.value(self.ifd1, JPEG_INTERCHANGE_FORMAT_LENGTH)
+        if not start or not length or start + length > len(self.data):
+            return None
+        return self.data[start:start + length]
+
+    def with_orientation(self, orientation):
+        """return the TIFF structure with an orientation entry in IFD0
+
+        IFD0 is written again at the end of the structure with the entry added or replaced, the
+        header points to the new copy. No other value moves, their offsets stay valid.
+
+        Args:
+            orientation (int): Exif orientation from 1 to 8
+
+        Returns:
+            bytes: TIFF structure
+        """
+        entries = {tag: self.data[entry:entry + 12] for tag, (_, _, entry) in self.ifd0.items()}
+        entries[ORIENTATION] = struct.pack(self.byte_order + 'HHIHH', ORIENTATION, 3, 1, orientation, 0)
+        _, next_ifd = self.read_ifd(self.unpack('I', 4))
+        # directories start on a word boundary
+        data = self.data + b'\x00' * (len(self.data) % 2)
+        ifd = (struct.pack(self.byte_order + 'H', len(entries)) + b''.join(entries[tag] for tag in sorted(entries))
+               + struct.pack(self.byte_order + 'I', next_ifd))
+        return data[:4] + struct.pack(self.byte_order + 'I', len(data)) + data[8:] + ifd
+
+
+def find_exif_segment(file):
+    """find the APP1 Exif segment of a JPEG file
+
+    Args:
+        file (file): JPEG file opened in binary mode
+
+    Returns:
+        tuple: (position of the TIFF structure, its length) or None
+    """
+    if file.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        marker = file.read(4)
+        if len(marker) < 4 or marker[0] != 0xff:
+            return None
+        code, length = marker[1], struct.unpack('>H', marker[2:])[0]
+        if code in (0xd9, 0xda):
+            # end of image or start of scan, no more metadata
+            return None
+        if code == 0xe1:
+            if file.read(6) == b'Exif\x00\x00':
+                return file.tell(), length - 8
+            file.seek(length - 8, 1)
+        else:
+            file.seek(length - 2, 1)
+
+
+def read_exif(path):
+    """read the Exif block of a JPEG file
+
+    Args:
+        path (string): image path
+
+    Returns:
+        Exif: Exif block or None if the file has none
+    """
+    try:
+        with open(path, 'rb') as file:
+            segment = find_exif_segment(file)
+            if segment is None:
+                return None
+            offset, length = segment
+            file.seek(offset)
+            data = file.read(length)
+        if data[:2] not in (b'II', b'MM'):
+            return None
+        return Exif(data, offset)
+    except (OSError, struct.error):
+        return None
+
+
+def write_orientation(path, orientation):
+    """write the orientation of a JPEG file without touching the compressed pixels
+
+    The tag is patched in place if the file has one, else it is added to the Exif block, and an Exif
+    segment holding only the orientation is inserted if the file has no Exif block.
+
+    Args:
+        path (string): JPEG file path
+        orientation (int): Exif orientation from 1 to 8
+
+    Returns:
+        boolean: False if the file is not a JPEG or its Exif segment is too large to hold the tag
+    """
+    exif = read_exif(path)
+    if exif is not None and exif.ifd0.get(ORIENTATION, (0, 0))[:2] == (3, 1):
+        with open(path, 'r+b') as file:
+            file.seek(exif.offset + exif.value_position(exif.ifd0, ORIENTATION))
+            file.write(struct.pack(exif.byte_order + 'H', orientation))
+        return True
+
+    with open(path, 'rb') as file:
+        data = file.read()
+    if data[:2] != b'\xff\xd8':
+        return False
+    if exif is not None:
+        tiff = exif.with_orientation(orientation)
+        if len(tiff) + 8 > 0xffff:
+            return False
+        # the segment marker, its length and the Exif header are before the TIFF structure
+        start, end = exif.offset - 10, exif.offset + len(exif.data)
+    else:
+        # big endian TIFF structure with an IFD0 of one SHORT entry
+        tiff = b'MM\x00\x2a' + struct.pack('>IHHHIHHI', 8, 1, ORIENTATION, 3, 1, orientation, 0, 0)
+        # the Exif segment follows the JFIF one if there is one
+        start = 2
+        if data[2:4] == b'\xff\xe0':
+            start = 4 + struct.unpack('>H', data[4:6])[0]
+        end = start
+    segment = b'\xff\xe1' + struct.pack('>H', len(tiff) + 8) + b'Exif\x00\x00' + tiff
+
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(data[:start] + segment + data[end:])
+        shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except OSError:
+        os.remove(temp_path)
+        raise
+    return True
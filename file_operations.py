@@ -0,0 +1,249 @@
+import errno
+import hashlib
+import os
+import shutil
+
+from collections import OrderedDict
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal, Slot
+
+# operations
+COPY = 0
+MOVE = 1
+DELETE = 2
+
+# policies when the destination file exists
+OVERWRITE = 0
+SKIP = 1
+RENAME = 2  # the file is written as 'name (1).ext'
+
+
+def free_name(path):
+    """return path, or 'name (n).ext' with the first n for which no file exists"""
+    name, extension = os.path.splitext(path)
+    count = 0
+    while os.path.lexists(path):
+        count += 1
+        path = '{0} ({1}){2}'.format(name, count, extension)
+    return path
+
+
+def move_file(src, dst):
+    """move a file, it is only renamed when both paths are on the same filesystem
+
+    Args:
+        src (string): source file
+        dst (string): destination file, replaced if it exists
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # copyfile uses the kernel copy paths (sendfile, fcopyfile) when the platform has them
+        shutil.copy2(src, dst)
+        os.remove(src)
+
+
+class ContentHashes:
+    """Hashes of file contents, cached by path, modification time and size"""
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.hashes = OrderedDict()  # (path, mtime, size) -> digest
+
+    def digest(self, path):
+        """return the hash of a file, read in chunks"""
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        digest = self.hashes.get(key)
+        if digest is not None:
+            self.hashes.move_to_end(key)
+            return digest
+
+        content_hash = hashlib.blake2b()
+        with open(path, 'rb') as file:
+            while chunk := file.read(self.CHUNK_SIZE):
+                content_hash.update(chunk)
+        digest = content_hash.digest()
+        self.hashes[key] = digest
+        while len(self.hashes) > self.max_entries:
+            self.hashes.popitem(last=False)
+        return digest
+
+    def same_content(self, path1, path2):
+        """return True if two files have the same content, the files are read only if their sizes match"""
+        if os.path.getsize(path1) != os.path.getsize(path2):
+            return False
+        return self.digest(path1) == self.digest(path2)
+
+
+class FileOperationResult:
+    def __init__(self, operation):
+        """
+        Args:
+            operation (int): COPY, MOVE or DELETE
+        """
+        self.operation = operation
+        self.done = []  # (src, dst), dst is None for a deletion
+        self.skipped = []  # src, including the files copied onto the same content
+        self.errors = []  # (src, error message)
+
+
+class FileOperationSignals(QObject):
+    progress = Signal(int, int, int)
+    finished = Signal(object)
+    conflicts_checked = Signal(int, object, object)
+
+
+class ConflictTask(QRunnable):
+    def __init__(self, operation, files, hashes, signals):
+        """
+        Args:
+            operation (int): COPY or MOVE
+            files (list): (src, dst)
+            hashes (ContentHashes): content hashes
+            signals (FileOperationSignals): signals
+        """
+        super(ConflictTask, self).__init__()
+        self.operation = operation
+        self.files = files
+        self.hashes = hashes
+        self.signals = signals
+
+    def run(self):
+        """list the destination files that exist with another content"""
+        conflicts = []
+        for src, dst in self.files:
+            try:
+                if os.path.lexists(dst) and not self.hashes.same_content(src, dst):
+                    conflicts.append((src, dst))
+            except OSError:
+                conflicts.append((src, dst))
+        self.signals.conflicts_checked.emit(self.operation, self.files, conflicts)
+
+
+class FileOperationTask(QRunnable):
+    def __init__(self, operation, files, policy, hashes, signals):
+        """
+        Args:
+            operation (int): COPY, MOVE or DELETE
+            files (list): (src, dst), dst is None for a deletion
+            policy (int): OVERWRITE, SKIP or RENAME when a destination file exists
+            hashes (ContentHashes): content hashes
+            signals (FileOperationSignals): signals
+        """
+        super(FileOperationTask, self).__init__()
+        self.operation = operation
+        self.files = files
+        self.policy = policy
+        self.hashes = hashes
+        self.signals = signals
+
+    def run(self):
+        result = FileOperationResult(self.operation)
+        for count, (src, dst) in enumerate(self.files, 1):
+            try:
+                if self.operation == DELETE:
+                    self.delete(src)
+                else:
+                    if os.path.lexists(dst):
+                        exists = os.path.exists(dst)  # False for a broken link
+                        if os.path.abspath(src) == os.path.abspath(dst) or exists and os.path.samefile(src, dst):
+                            # the destination is the source itself, or a link to it
+                            result.skipped.append(src)
+                            continue
+                        if exists and self.hashes.same_content(src, dst):
+                            if self.operation == MOVE:
+                                # the destination already holds the moved content, only the source is left
+                                os.remove(src)
+                                result.done.append((src, dst))
+                            else:
+                                result.skipped.append(src)
+                            continue
+                        if self.policy == SKIP:
+                            result.skipped.append(src)
+                            continue
+                        elif self.policy == RENAME:
+                            dst = free_name(dst)
+                    if self.operation == MOVE:
+                        move_file(src, dst)
+                    else:
+                        shutil.copy(src, dst)
+                result.done.append((src, dst))
+            except OSError as e:
+                result.errors.append((src, str(e)))
+            finally:
+                self.signals.progress.emit(self.operation, count, len(self.files))
+        self.signals.finished.emit(result)
+
+    @staticmethod
+    def delete(src):
+        try:
+            os.remove(src)
+        except FileNotFoundError:
+            # already removed, the file is dropped from the list all the same
+            pass
+
+
+class FileOperations(QObject):
+    """Copy, move and delete batches of files in a worker thread
+
+    Batches are run one after the other, in the order they are started.
+    """
+
+    progress = Signal(int, int, int)  # operation, files done, files in the batch
+    finished = Signal(object)  # FileOperationResult
+    conflicts_checked = Signal(int, object, object)  # operation, files, files whose destination differs
+
+    def __init__(self, parent=None):
+        super(FileOperations, self).__init__(parent)
+        self.pending = []  # queued or running tasks
+        self.hashes = ContentHashes()
+
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+
+        self.signals = FileOperationSignals(self)
+        self.signals.progress.connect(self.progress)
+        self.signals.finished.connect(self.on_finished)
+        self.signals.conflicts_checked.connect(self.on_conflicts_checked)
+
+    def check_conflicts(self, operation, files):
+        """compare the files with the destination files that exist, after the queued batches
+
+        Files of the same size are compared by a hash of their content, the identical ones are not
+        conflicts.
+
+        Args:
+            operation (int): COPY or MOVE
+            files (list): (src, dst)
+        """
+        task = ConflictTask(operation, files, self.hashes, self.signals)
+        task.setAutoDelete(False)
+        self.pending.append(task)
+        self.thread_pool.start(task)
+
+    def start(self, operation, files, policy=OVERWRITE):
+        """queue a batch
+
+        Args:
+            operation (int): COPY, MOVE or DELETE
+            files (list): (src, dst), dst is None for a deletion
+            policy (int): OVERWRITE, SKIP or RENAME when a destination file exists
+        """
+        task = FileOperationTask(operation, files, policy, self.hashes, self.signals)
+        task.setAutoDelete(False)
+        self.pending.append(task)
+        self.thread_pool.start(task)
+
+    @Slot(object)
+    def on_finished(self, result):
+        self.pending.pop(0)
+        self.finished.emit(result)
+
+    @Slot(int, object, object)
+    def on_conflicts_checked(self, operation, files, conflicts):
+        self.pending.pop(0)
+        self.conflicts_checked.emit(operation, files, conflicts)
@@ -0,0 +1,69 @@
+import time
+
+from PySide6.QtCore import QFileSystemWatcher, QObject, QTimer, Signal, Slot
+from directory_scanner import DirectoryScanner
+
+
+class FolderWatcher(QObject):
+    """Watch the displayed directory and rescan it once a burst of changes is over
+
+    A burst of changes triggers a single scan after `delay` ms of quiet, or after
+    `max_delay` ms if the directory never stops changing. The directory is scanned in a worker
+    thread, a slow or large directory does not freeze the window.
+    """
+
+    directory_changed = Signal(object)  # ScanResult
+
+    def __init__(self, extensions, parent=None, delay=300, max_delay=2000, catalog=None):
+        super(FolderWatcher, self).__init__(parent)
+        self.extensions = extensions
+        self.catalog = catalog
+        self.directory = None
+        self.max_delay = max_delay / 1000
+        self.first_change = None
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.rescan)
+
+        self.scanner = DirectoryScanner(self)
+        self.scanner.scanned.connect(self.directory_changed)
+
+    def watch(self, directory):
+        """watch a directory instead of the previous one
+
+        Args:
+            directory (string): directory path
+        """
+        self.stop()
+        self.directory = directory
+        self.watcher.addPath(directory or '.')
+
+    def stop(self):
+        """stop watching, as while a directory tree is browsed"""
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        self.timer.stop()
+        self.scanner.cancel()
+        self.first_change = None
+        self.directory = None
+
+    @Slot(str)
+    def on_directory_changed(self, path):
+        now = time.monotonic()
+        if self.first_change is None:
+            self.first_change = now
+        # past max_delay the timer is no longer pushed back
+        if now - self.first_change < self.max_delay or not self.timer.isActive():
+            self.timer.start()
+
+    @Slot()
+    def rescan(self):
+        self.timer.stop()
+        self.first_change = None
+        if self.directory is not None:
+            self.scanner.scan(self.directory, self.extensions, self.catalog)
@@ -0,0 +1,111 @@
+import os
+
+from collections import OrderedDict
+
+
+class ImageCache:
+    """LRU cache of decoded images bounded by a memory budget
+
+    Entries are keyed by (path, st_mtime_ns, st_size) so that an image modified by another
+    program is decoded again.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()  # path -> (key, image, size in bytes)
+
+    @staticmethod
+    def key(path):
+        """return the cache key of a file
+
+        Args:
+            path (string): image path
+
+        Returns:
+            tuple: (path, st_mtime_ns, st_size) or None if the file cannot be stat
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return path, stat.st_mtime_ns, stat.st_size
+
+    def __contains__(self, path):
+        entry = self.entries.get(path)
+        return entry is not None and entry[0] == self.key(path)
+
+    def get(self, path):
+        """return the decoded image of a file if it is cached and up to date
+
+        Args:
+            path (string): image path
+
+        Returns:
+            QImage: decoded image or None
+        """
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == self.key(path):
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return entry[1]
+
+        if entry is not None:
+            self.remove(path)
+        self.misses += 1
+        return None
+
+    def put(self, path, image, key=None):
+        """add a decoded image, the least recently used images are evicted to fit in the budget
+
+        Args:
+            path (string): image path
+            image (QImage): decoded image
+            key (tuple): key of the file when it was read, computed now if None
+        """
+        if key is None:
+            key = self.key(path)
+        size = image.sizeInBytes()
+        self.remove(path)
+        if key is None or size > self.max_bytes:
+            return
+
+        self.entries[path] = (key, image, size)
+        self.bytes += size
+        self.evict()
+
+    def remove(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def evict(self):
+        while self.bytes > self.max_bytes and self.entries:
+            path, entry = self.entries.popitem(last=False)
+            self.bytes -= entry[2]
+
+    def stats(self):
+        """return cache counters
+
+        Returns:
+            dict: hits, misses, hit rate, number of images, used and max bytes
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'count': len(self.entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+        }
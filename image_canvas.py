@@ -0,0 +1,197 @@
+from PySide6.QtCore import QObject, QRectF, QRunnable, QSize, Qt, QThreadPool, Signal, Slot
+from PySide6.QtGui import QImage, QPainter, QPixmap, QTransform
+from PySide6.QtWidgets import QWidget
+from profiler import Stopwatch, profiler
+
+
+class MipmapSignals(QObject):
+    loaded = Signal(int, QImage)
+
+
+class MipmapTask(QRunnable):
+    def __init__(self, image, generation, min_size, signals, path=None):
+        super(MipmapTask, self).__init__()
+        self.image = image
+        self.generation = generation
+        self.min_size = min_size
+        self.signals = signals
+        self.path = path
+        self.cancelled = False
+
+    def run(self):
+        """halve the image until it is smaller than min_size, each level is sent when it is ready
+
+        The image is released as soon as the task is cancelled, between two levels.
+        """
+        stopwatch = Stopwatch() if profiler.enabled and self.path else None
+        image = self.image
+        self.image = None
+        level = 0
+        while image.width() // 2 >= self.min_size and image.height() // 2 >= self.min_size:
+            if self.cancelled:
+                return
+            image = image.scaled(image.width() // 2, image.height() // 2, Qt.IgnoreAspectRatio,
+                                 Qt.SmoothTransformation)
+            level += 1
+            if stopwatch:
+                stopwatch.lap('level_{0}'.format(level))
+            self.signals.loaded.emit(self.generation, image)
+        if stopwatch:
+            profiler.record('scale', self.path, levels=level, **stopwatch.total())
+
+
+class ImageCanvas(QWidget):
+    """Paint an image scaled to the widget size
+
+    The canvas keeps a pyramid of pre-scaled levels (1/2, 1/4, ...) of the image, built in
+    background, and paints only the exposed rect from the smallest level still larger than the
+    display. Zooming and panning a large image never rescale the full resolution pixmap.
+
+    Rotations and flips are a transform applied while painting, the pixels are never copied.
+    """
+
+    MIN_LEVEL_SIZE = 256
+
+    def __init__(self, parent=None):
+        super(ImageCanvas, self).__init__(parent)
+        self.levels = []  # QPixmap for 1, 1/2, 1/4, ...
+        self.animation = None
+        self.orientation = QTransform()
+        self.fast_transform = False
+        self.generation = 0
+        self.task = None  # MipmapTask building the levels of the image
+        self.profiled_path = None  # path of the image whose first paint is recorded
+
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+        self.signals = MipmapSignals(self)
+        self.signals.loaded.connect(self.on_mipmap_loaded)
+
+    def set_pixmap(self, pixmap, image=None, path=None):
+        """display a pixmap
+
+        Args:
+            pixmap (QPixmap): image to display
+            image (QImage): same image, used to build the levels without converting the pixmap back
+            path (string): image path, its scale and first paint are timed while profiling
+        """
+        self.clear()
+        self.levels = [pixmap]
+        self.profiled_path = path if profiler.enabled else None
+        if pixmap.width() // 2 >= self.MIN_LEVEL_SIZE and pixmap.height() // 2 >= self.MIN_LEVEL_SIZE:
+            if image is None:
+                image = pixmap.toImage()
+            self.task = MipmapTask(image, self.generation, self.MIN_LEVEL_SIZE, self.signals, self.profiled_path)
+            self.task.setAutoDelete(False)
+            self.thread_pool.start(self.task)
+        self.update()
+
+    def set_animation(self, animation):
+        """display the frames of an animation, it is started
+
+        Args:
+            animation (AnimationPlayer): animated image
+        """
+        self.clear()
+        self.animation = animation
+        self.animation.frame_changed.connect(self.on_frame_changed)
+        self.animation.start()
+        self.update()
+
+    def set_orientation(self, orientation):
+        """display the image rotated or flipped
+
+        Args:
+            orientation (QTransform): rotation by a multiple of 90 degrees and flips
+        """
+        self.orientation = orientation
+        self.update()
+
+    def clear(self):
+        self.generation += 1
+        if self.task is not None:
+            # the levels of the previous image are not built, its full resolution image is released
+            self.task.cancelled = True
+            self.thread_pool.tryTake(self.task)
+            self.task = None
+        self.levels = []
+        self.profiled_path = None
+        self.orientation = QTransform()
+        if self.animation:
+            self.animation.stop()
+            self.animation.frame_changed.disconnect(self.on_frame_changed)
+            self.animation.deleteLater()
+            self.animation = None
+        self.update()
+
+    def set_fast_transform(self, fast_transform):
+        """paint with a fast transformation, while the window is resized
+
+        Args:
+            fast_transform (boolean): True for nearest neighbor scaling, False for smooth scaling
+        """
+        self.fast_transform = fast_transform
+        self.update()
+
+    def pixmap(self):
+        """return the level to paint at the current size"""
+        if self.animation:
+            return self.animation.current_pixmap()
+        if not self.levels:
+            return QPixmap()
+        size = self.unoriented_size()
+        for pixmap in reversed(self.levels):
+            if pixmap.width() >= size.width() and pixmap.height() >= size.height():
+                return pixmap
+        return self.levels[0]
+
+    def unoriented_size(self):
+        """return the widget size before the orientation is applied"""
+        if self.orientation.m11() == 0:
+            # rotated by 90 or 270 degrees
+            return QSize(self.height(), self.width())
+        return self.size()
+
+    def sizeHint(self):
+        if self.levels:
+            return self.orientation.mapRect(self.levels[0].rect()).size()
+        if self.animation:
+            return self.animation.size()
+        return QSize()
+
+    def paintEvent(self, event):
+        pixmap = self.pixmap()
+        if pixmap.isNull() or self.width() == 0 or self.height() == 0:
+            return
+
+        # the orientation around the origin, then moved back in the widget
+        size = self.unoriented_size()
+        bounds = self.orientation.mapRect(QRectF(0, 0, size.width(), size.height()))
+        transform = self.orientation * QTransform.fromTranslate(-bounds.x(), -bounds.y())
+
+        stopwatch = Stopwatch() if self.profiled_path else None
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, not self.fast_transform)
+        painter.setTransform(transform)
+        rect = transform.inverted()[0].mapRect(QRectF(event.rect()))
+        ratio_x = pixmap.width() / size.width()
+        ratio_y = pixmap.height() / size.height()
+        source = QRectF(rect.x() * ratio_x, rect.y() * ratio_y, rect.width() * ratio_x, rect.height() * ratio_y)
+        painter.drawPixmap(rect, pixmap, source)
+        if stopwatch:
+            painter.end()
+            stopwatch.lap('paint')
+            profiler.record('paint', self.profiled_path, width=pixmap.width(), height=pixmap.height(),
+                            **stopwatch.total())
+            self.profiled_path = None
+
+    @Slot()
+    def on_frame_changed(self):
+        self.update()
+
+    @Slot(int, QImage)
+    def on_mipmap_loaded(self, generation, image):
+        if generation != self.generation or not self.levels:
+            return
+        self.levels.append(QPixmap.fromImage(image))
+        self.update()
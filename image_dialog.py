@@ -5,7 +5,8 @@ from math import floor, log, pow
 from PySide6.QtCore import QSize, Qt
 from PySide6.QtWidgets import (QDialog, QDialogButtonBox, QGridLayout, QHBoxLayout, QFrame,
                                QLabel, QLineEdit, QPushButton)
-from PySide6.QtGui import QImageReader, QPixmap, QMovie
+from PySide6.QtGui import QPixmap
+from thumbnail_cache import ThumbnailCache
 
 
 class ImageDialog(QDialog):
@@ -36,7 +37,7 @@ class ImageDialog(QDialog):
         src_date = datetime.fromtimestamp(os.path.getmtime(src)).ctime()
         src_size = self.convert_size(os.path.getsize(src))
         src_info = str_format.format(src_date, src_size)
-        dst_date = datetime.fromtimestamp(os.path.getmtime(src)).ctime()
+        dst_date = datetime.fromtimestamp(os.path.getmtime(dst)).ctime()
         dst_size = self.convert_size(os.path.getsize(dst))
         dst_info = str_format.format(dst_date, dst_size)
 
@@ -90,17 +91,11 @@ class ImageDialog(QDialog):
         self.setLayout(self.grid)
 
     def display_image(self, label, file):
-        image_reader = QImageReader(file)
-        if image_reader.imageCount() > 1:
-            movie = QMovie(file,)
-            movie.setCacheMode(QMovie.CacheAll)
-            movie.jumpToFrame(0)
-            size = QSize(min(label.width(), label.height()), min(label.width(), label.height()))
-            movie.setScaledSize(size)
-            label.setMovie(movie)
-            movie.start()
-        else:
-            label.setPixmap((QPixmap(file).scaled(label.size(), Qt.KeepAspectRatio)))
+        """display the thumbnail of a file, the image is decoded only if it has no thumbnail yet"""
+        size = QSize(180, 120)
+        image = ThumbnailCache(max(size.width(), size.height())).thumbnail(file, size)
+        if not image.isNull():
+            label.setPixmap(QPixmap.fromImage(image.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)))
 
     def convert_size(self, size):
         if size == 0:
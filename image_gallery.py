@@ -1,83 +1,458 @@
 import os
-import shiboken2
 
-from PySide6.QtCore import QSize, Qt, QTimer, QEventLoop, Slot
-from PySide6.QtGui import QCursor, QImageReader, QMovie, QPixmap
-from PySide6.QtWidgets import QAbstractItemView, QLabel, QListWidget, QListWidgetItem
+from collections import OrderedDict
+from PySide6.QtCore import (QAbstractListModel, QItemSelectionModel, QModelIndex, QObject, QRunnable, QSize, Qt,
+                            QThread, QThreadPool, Signal, Slot)
+from PySide6.QtGui import QCursor, QImage, QImageReader, QPixmap
+from PySide6.QtWidgets import QAbstractItemView, QListView, QStyle, QStyledItemDelegate
+from animation_player import AnimationPlayer, is_animated
+from profiler import Stopwatch, profiler
+from thumbnail_cache import ThumbnailCache
 
 
-class ImageGallery(QListWidget):
+class ThumbnailSignals(QObject):
+    loaded = Signal(str, QImage, object)
+
+
+class ThumbnailTask(QRunnable):
+    def __init__(self, path, size, thumbnail_cache, signals, check_animation=False):
+        super(ThumbnailTask, self).__init__()
+        self.path = path
+        self.size = size
+        self.thumbnail_cache = thumbnail_cache
+        self.signals = signals
+        self.check_animation = check_animation
+
+    def run(self):
+        """load the thumbnail, and tell if the image is animated when its metadata is not known"""
+        stopwatch = Stopwatch() if profiler.enabled else None
+        image = self.thumbnail_cache.thumbnail(self.path, self.size, stopwatch)
+        if not image.isNull():
+            image = image.scaled(self.size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        if stopwatch:
+            stopwatch.lap('scale')
+            profiler.record('thumbnail', self.path, **stopwatch.total())
+        # an animation is parsed here rather than when it is hovered
+        animated = is_animated(QImageReader(self.path)) if self.check_animation else None
+        self.signals.loaded.emit(self.path, image, animated)
+
+
+class ImageGalleryModel(QAbstractListModel):
+    """List of images whose thumbnails are loaded in background when a view asks for them
+
+    Only a bounded number of thumbnail pixmaps is kept, the least recently used are released.
+    Thumbnails are still images, only the animations asked by the view are played.
+    """
+
+    def __init__(self, size, parent=None, max_thumbnails=512):
+        super(ImageGalleryModel, self).__init__(parent)
+        self.size = size
+        self.images = []
+        self.rows = {}  # path -> row
+        self.max_thumbnails = max_thumbnails
+        self.thumbnails = OrderedDict()  # path -> QPixmap, null if the file cannot be decoded
+        self.pending = {}  # path -> queued or running task
+        self.priority = 0
+        self.animated = {}  # path -> True if the image has several frames, known once its thumbnail is loaded
+        self.playing = set()  # paths whose animations are asked by the view
+        self.groups = {}  # path -> number of the group of similar images it belongs to
+        self.animations = {}  # path -> AnimationPlayer
+        self.metadata = {}  # path -> FileInfo read from the catalog
+        self.hits = 0  # thumbnails asked by the view that were in memory
+        self.misses = 0
+
+        self.thumbnail_cache = ThumbnailCache(max(size.width(), size.height()))
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(max(1, QThread.idealThreadCount() // 2))
+        self.signals = ThumbnailSignals(self)
+        self.signals.loaded.connect(self.on_thumbnail_loaded)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.images)
+
+    def data(self, index, role=Qt.DisplayRole):
+        # no None is returned, PySide6 6.12 drops a reference to None each time data() returns it to Qt
+        valid = index.isValid() and index.row() < len(self.images)
+        path = self.images[index.row()] if valid else ''
+        if role == Qt.DecorationRole:
+            if not valid:
+                return QPixmap()
+            animation = self.animations.get(path)
+            if animation and not animation.current_pixmap().isNull():
+                return animation.current_pixmap()
+            return self.thumbnail(path)
+        elif role == Qt.ToolTipRole and valid:
+            info = self.metadata.get(path)
+            lines = [os.path.basename(path)]
+            if info and info.width is not None:
+                lines.append('{0} x {1}'.format(info.width, info.height))
+            if info and info.date:
+                lines.append(info.date)
+            return '\n'.join(lines)
+        elif role == Qt.UserRole:
+            return path
+        elif role == Qt.UserRole + 1:
+            return self.groups.get(path, 0)
+        # text roles are empty, the delegate does not ask for the other ones
+        return ''
+
+    def set_images(self, images, groups=None, rows=None):
+        """replace the list of images
+
+        Args:
+            images (list): list of image path
+            groups (dict): path -> group number of similar images, None if the images are not grouped
+            rows (dict): path -> row of the images if it is known, copied
+        """
+        self.beginResetModel()
+        self.cancel()
+        self.animate(())
+        # the animations of the thumbnails in memory stay known
+        self.animated = {path: self.animated[path] for path in self.thumbnails if path in self.animated}
+        self.groups = groups or {}
+        self.images = list(images)
+        self.rows = dict(rows) if rows is not None else {path: row for row, path in enumerate(self.images)}
+        self.endResetModel()
+
+    def set_metadata(self, metadata):
+        """replace the metadata of the images
+
+        Args:
+            metadata (dict): path -> FileInfo
+        """
+        self.metadata = dict(metadata)
+
+    def update_metadata(self, metadata):
+        """add or replace the metadata of images, the animations of the files changed are checked again
+
+        Args:
+            metadata (dict): path -> FileInfo
+        """
+        self.metadata.update(metadata)
+        for path, info in metadata.items():
+            if info.mtime_ns is not None:
+                self.animated[path] = info.frames != 1
+
+    def insert_rows(self, rows):
+        """insert images
+
+        Args:
+            rows (list): (row, path) sorted by row, rows are the final positions
+        """
+        for row, path in rows:
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.images.insert(row, path)
+            self.endInsertRows()
+        self.rows = {path: row for row, path in enumerate(self.images)}
+
+    def append_rows(self, images):
+        """append images after the listed ones
+
+        Args:
+            images (list): list of image path
+        """
+        if not images:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.images), len(self.images) + len(images) - 1)
+        self.rows.update((path, row) for row, path in enumerate(images, len(self.images)))
+        self.images.extend(images)
+        self.endInsertRows()
+
+    def remove_rows(self, rows):
+        """remove images
+
+        Args:
+            rows (list): rows to remove
+        """
+        for row in sorted(rows, reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            path = self.images.pop(row)
+            self.thumbnails.pop(path, None)
+            self.animated.pop(path, None)
+            self.groups.pop(path, None)
+            self.stop_animation(path)
+            self.endRemoveRows()
+        self.rows = {path: row for row, path in enumerate(self.images)}
+
+    def thumbnail(self, path):
+        """return the thumbnail of an image, it is loaded in background if it is not in memory
+
+        Args:
+            path (string): image path
+
+        Returns:
+            QPixmap: thumbnail or a null pixmap while it is loading
+        """
+        pixmap = self.thumbnails.get(path)
+        if pixmap is not None:
+            self.hits += 1
+            self.thumbnails.move_to_end(path)
+            return pixmap
+
+        if path not in self.pending:
+            self.misses += 1
+            info = self.metadata.get(path)
+            if path not in self.animated and info is not None and info.mtime_ns is not None:
+                self.animated[path] = info.frames != 1
+            task = ThumbnailTask(path, self.size, self.thumbnail_cache, self.signals, path not in self.animated)
+            task.setAutoDelete(False)
+            self.pending[path] = task
+            # the last requested rows are the ones on screen, they go first
+            self.priority += 1
+            self.thread_pool.start(task, self.priority)
+        return QPixmap()
+
+    def cached_thumbnail(self, path):
+        """return the thumbnail of an image if it is in memory, it is not loaded otherwise"""
+        pixmap = self.thumbnails.get(path)
+        return pixmap if pixmap else None
+
+    def cancel(self, keep=()):
+        """cancel the queued thumbnail loads
+
+        Args:
+            keep (iterable): paths whose loads are kept
+        """
+        keep = set(keep)
+        for path, task in list(self.pending.items()):
+            if path not in keep and self.thread_pool.tryTake(task):
+                del self.pending[path]
+
+    def animate(self, paths):
+        """play the animated images of paths, the other animations are stopped
+
+        An image whose thumbnail is not loaded yet is played once the thumbnail task tells it is animated.
+
+        Args:
+            paths (iterable): image paths
+        """
+        self.playing = set(paths)
+        for path in list(self.animations):
+            if path not in self.playing:
+                self.stop_animation(path)
+                self.on_frame_changed(path)
+        for path in self.playing:
+            if path not in self.animations and self.animated.get(path):
+                self.start_animation(path)
+
+    def start_animation(self, path):
+        animation = AnimationPlayer(path, self, scaled_size=self.size)
+        animation.frame_changed.connect(lambda path=path: self.on_frame_changed(path))
+        self.animations[path] = animation
+        animation.start()
+
+    def stop_animation(self, path):
+        animation = self.animations.pop(path, None)
+        if animation:
+            animation.stop()
+            animation.deleteLater()
+
+    def on_frame_changed(self, path):
+        row = self.rows.get(path)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    @Slot(str, QImage, object)
+    def on_thumbnail_loaded(self, path, image, animated):
+        if self.pending.pop(path, None) is None:
+            return
+        if animated is not None:
+            self.animated[path] = animated
+            if animated and path in self.playing and path not in self.animations:
+                self.start_animation(path)
+
+        self.thumbnails[path] = QPixmap.fromImage(image)
+        while len(self.thumbnails) > self.max_thumbnails:
+            self.thumbnails.popitem(last=False)
+
+        row = self.rows.get(path)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class ImageGalleryDelegate(QStyledItemDelegate):
+    """Paint the thumbnail of an item centered in a cell of fixed size
+
+    Groups of similar images are told apart by an alternate background.
+    """
+
+    def __init__(self, size, parent=None):
+        super(ImageGalleryDelegate, self).__init__(parent)
+        self.size = size
+
+    def paint(self, painter, option, index):
+        # the style options of the view are enough, initStyleOption() would ask the model for the font,
+        # colors and check state roles it does not hold
+        if index.data(Qt.UserRole + 1) % 2:
+            painter.fillRect(option.rect, option.palette.alternateBase())
+        style = option.widget.style() if option.widget else None
+        if style:
+            style.drawPrimitive(QStyle.PE_PanelItemViewItem, option, painter, option.widget)
+
+        pixmap = index.data(Qt.DecorationRole)
+        if pixmap:
+            x = option.rect.x() + (option.rect.width() - pixmap.width()) // 2
+            y = option.rect.y() + (option.rect.height() - pixmap.height()) // 2
+            painter.drawPixmap(x, y, pixmap)
+
+    def sizeHint(self, option, index):
+        return self.size
+
+
+class ImageGallery(QListView):
+    """Thumbnails of the images, an animated image is played while it is hovered or selected"""
+
     def __init__(self, parent):
         super(ImageGallery, self).__init__()
         self.size = QSize(180, 120)
         self.parent = parent
+        self.hovered = None  # path under the mouse
+        self.scroll_row = None  # selected row to scroll to once it is laid out
+
+        self.gallery_model = ImageGalleryModel(self.size, self)
+        self.setModel(self.gallery_model)
+        self.setItemDelegate(ImageGalleryDelegate(self.size, self))
+        self.setUniformItemSizes(True)
+        # a long list is laid out over several event loop iterations rather than at once
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(2000)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setMouseTracking(True)
+        self.verticalScrollBar().valueChanged.connect(self.cancel_hidden)
+        self.verticalScrollBar().valueChanged.connect(self.update_animations)
 
-    def add_images(self, images):
+    def add_images(self, images, groups=None, rows=None):
         """add images list to the list box
 
         Args:
             images (list): list of image path
+            groups (dict): path -> group number of similar images, None if the images are not grouped
+            rows (dict): path -> row of the images if it is known, copied
         """
-        self.clear()
-        self.images = images
-        if len(images):
-            QTimer.singleShot(0, self.load_images)
-
-    def for_loop_files(self, images, interval=100, parent=None, objectName=""):
-        timer = QTimer(parent=parent, singleShot=True, interval=interval)
-        if objectName:
-            timer.setObjectName(objectName)
-        loop = QEventLoop(timer)
-        timer.timeout.connect(loop.quit)
-        timer.destroyed.connect(loop.quit)
-
-        for image_path in images:
-            if shiboken2.isValid(timer):
-                timer.start()
-                loop.exec_()
-                yield image_path
+        self.gallery_model.set_images(images, groups, rows)
+
+    def visible_rows(self):
+        """return the range of rows displayed in the viewport"""
+        first = self.indexAt(self.viewport().rect().topLeft())
+        last = self.indexAt(self.viewport().rect().bottomLeft())
+        first_row = first.row() if first.isValid() else 0
+        last_row = last.row() if last.isValid() else self.count() - 1
+        return range(first_row, last_row + 1)
+
+    @Slot()
+    def cancel_hidden(self):
+        """cancel the thumbnail loads of the rows scrolled out of the viewport"""
+        images = self.gallery_model.images
+        self.gallery_model.cancel(images[row] for row in self.visible_rows())
 
     @Slot()
-    def load_images(self):
-        for path in self.for_loop_files(images=self.images, interval=1, parent=self, objectName="icon_timer"):
-            if os.path.isfile(path):
-                image = QLabel()
-                image.setAlignment(Qt.AlignCenter)
-
-                image_reader = QImageReader(path)
-                if image_reader.imageCount() > 1:
-                    # Animated image
-                    movie = QMovie(path)
-                    movie.setCacheMode(QMovie.CacheAll)
-                    movie.jumpToFrame(0)
-                    movie.setScaledSize(self.size)
-                    image.setMovie(movie)
-                    movie.start()
-                else:
-                    image.setPixmap((QPixmap(path).scaled(
-                        self.size, Qt.KeepAspectRatio, Qt.FastTransformation)))
-
-                item = QListWidgetItem(self)
-                item.setSizeHint(self.size)
-                self.setItemWidget(item, image)
-
-                if path == self.images[self.parent.index]:
-                    self.select_row(self.parent.index)
+    def update_animations(self):
+        """play the hovered and the selected images if they are on screen, stop the others"""
+        paths = []
+        if self.isVisible():
+            images = self.gallery_model.images
+            visible = self.visible_rows()
+            for path in (self.hovered, self.current_path()):
+                row = self.gallery_model.rows.get(path)
+                if row is not None and row in visible:
+                    paths.append(images[row])
+        self.gallery_model.animate(paths)
+
+    def current_path(self):
+        return self.currentIndex().data(Qt.UserRole)
+
+    def mouseMoveEvent(self, event):
+        super(ImageGallery, self).mouseMoveEvent(event)
+        hovered = self.indexAt(event.position().toPoint()).data(Qt.UserRole)
+        if hovered != self.hovered:
+            self.hovered = hovered
+            self.update_animations()
+
+    def leaveEvent(self, event):
+        super(ImageGallery, self).leaveEvent(event)
+        self.hovered = None
+        self.update_animations()
+
+    def currentChanged(self, current, previous):
+        super(ImageGallery, self).currentChanged(current, previous)
+        self.update_animations()
+
+    def showEvent(self, event):
+        super(ImageGallery, self).showEvent(event)
+        self.update_animations()
+
+    def hideEvent(self, event):
+        super(ImageGallery, self).hideEvent(event)
+        self.gallery_model.animate(())
+
+    def cached_thumbnail(self, path):
+        return self.gallery_model.cached_thumbnail(path)
+
+    def set_metadata(self, metadata):
+        self.gallery_model.set_metadata(metadata)
+
+    def update_metadata(self, metadata):
+        self.gallery_model.update_metadata(metadata)
+
+    def count(self):
+        return self.gallery_model.rowCount()
+
+    def hit_rate(self):
+        """return the share of the thumbnails asked by the view that were in memory"""
+        lookups = self.gallery_model.hits + self.gallery_model.misses
+        return self.gallery_model.hits / lookups if lookups else 0.0
+
+    def currentRow(self):
+        return self.currentIndex().row()
 
     def select_row(self, index):
         if index > -1 and index < self.count():
-            self.setCurrentRow(index)
-            self.scrollToItem(self.item(index), QAbstractItemView.PositionAtCenter)
+            model_index = self.gallery_model.index(index)
+            if self.selectionModel().isSelected(model_index):
+                # a row of a multiple selection, the selection is kept
+                self.selectionModel().setCurrentIndex(model_index, QItemSelectionModel.NoUpdate)
+            else:
+                self.setCurrentIndex(model_index)
+            self.scrollTo(model_index, QAbstractItemView.PositionAtCenter)
+            self.scroll_row = index
+
+    def updateGeometries(self):
+        super(ImageGallery, self).updateGeometries()
+        if self.scroll_row is not None and self.scroll_row < self.count():
+            # the layout was not done when the row was selected
+            model_index = self.gallery_model.index(self.scroll_row)
+            if self.visualRect(model_index).isValid():
+                self.scrollTo(model_index, QAbstractItemView.PositionAtCenter)
+                if self.viewport().rect().intersects(self.visualRect(model_index)):
+                    self.scroll_row = None
+
+    def selected_paths(self):
+        """return the paths of the selected rows, in the order of the list"""
+        images = self.gallery_model.images
+        return [images[row] for row in sorted(index.row() for index in self.selectedIndexes())]
 
     def select_row_pos(self):
-        pos = self.mapFromGlobal(QCursor.pos())
-        item = self.itemAt(pos)
-        if item:
-            self.setCurrentItem(item)
+        pos = self.viewport().mapFromGlobal(QCursor.pos())
+        model_index = self.indexAt(pos)
+        if model_index.isValid():
+            self.setCurrentIndex(model_index)
             return self.currentRow()
+        return -1
 
-    def remove_row(self, index):
-        if index > -1 and index < self.count():
-            item = self.takeItem(index)  # noqa : F841
-            del item
-            self.scrollToItem(self.item(index), QAbstractItemView.PositionAtCenter)
+    def insert_rows(self, rows):
+        """insert images
+
+        Args:
+            rows (list): (row, path) sorted by row, rows are the final positions
+        """
+        self.gallery_model.insert_rows(rows)
+
+    def append_rows(self, images):
+        self.gallery_model.append_rows(images)
+
+    def remove_rows(self, rows):
+        self.gallery_model.remove_rows(rows)
@@ -0,0 +1,209 @@
+from PySide6.QtCore import QBuffer, QByteArray, QObject, QRunnable, QSize, Qt, QThread, QThreadPool, Signal, Slot
+from PySide6.QtGui import QImage, QImageReader
+from animation_player import is_animated
+from image_cache import ImageCache
+from profiler import Stopwatch, profiler
+from tiled_image import fitting_size, needs_tiles, too_large
+
+# kinds of image
+STILL = 0
+ANIMATED = 1  # played by an AnimationPlayer
+TILED = 2  # too large to be decoded at once, decoded by tiles
+
+
+class ImageLoaderSignals(QObject):
+    loaded = Signal(str, QImage, int, object)
+    preview_loaded = Signal(str, QImage, QSize)
+
+
+class ImageLoaderTask(QRunnable):
+    def __init__(self, path, signals):
+        super(ImageLoaderTask, self).__init__()
+        self.path = path
+        self.signals = signals
+
+    def run(self):
+        """decode the image in a worker thread
+
+        Animated and tiled images are not decoded here, they are decoded by the view. An image too
+        large to be decoded at once in a format that cannot be tiled is decoded at a reduced size if
+        the format decodes scaled, else the image is null.
+        """
+        stopwatch = Stopwatch() if profiler.enabled else None
+        key = ImageCache.key(self.path)
+        if stopwatch:
+            stopwatch.lap('stat')
+        image_reader = QImageReader(self.path)
+        if is_animated(image_reader):
+            kind, image = ANIMATED, QImage()
+        elif needs_tiles(image_reader):
+            kind, image = TILED, QImage()
+        else:
+            kind = STILL
+            size = image_reader.size()
+            scaled = too_large(image_reader)
+            if stopwatch:
+                stopwatch.lap('header')
+                # the file is read before the decode to time both
+                buffer = self.read_file()
+                stopwatch.lap('read')
+                if buffer is not None:
+                    image_reader = QImageReader(buffer, image_reader.format())
+            if scaled:
+                image_reader.setScaledSize(fitting_size(size))
+            image = image_reader.read()
+        if stopwatch:
+            stopwatch.lap('decode' if kind == STILL else 'header')
+            profiler.record('decode', self.path, kind=kind, width=image.width(), height=image.height(),
+                            **stopwatch.total())
+        self.signals.loaded.emit(self.path, image, kind, key)
+
+    def read_file(self):
+        """return the content of the file in a buffer, None if it cannot be read"""
+        try:
+            with open(self.path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None
+        buffer = QBuffer()
+        buffer.setData(QByteArray(data))
+        return buffer
+
+
+class PreviewTask(QRunnable):
+    def __init__(self, path, size, signals):
+        super(PreviewTask, self).__init__()
+        self.path = path
+        self.size = size
+        self.signals = signals
+
+    def run(self):
+        """decode the image at a reduced size, the JPEG decoder skips DCT scales"""
+        stopwatch = Stopwatch() if profiler.enabled else None
+        image_reader = QImageReader(self.path)
+        image_size = image_reader.size()
+        if (not image_size.isValid() or is_animated(image_reader)
+                or (image_size.width() <= 2 * self.size.width() and image_size.height() <= 2 * self.size.height())):
+            # no preview for an animated image or for an image small enough to be decoded quickly
+            self.signals.preview_loaded.emit(self.path, QImage(), image_size)
+            return
+        image_reader.setScaledSize(image_size.scaled(self.size, Qt.KeepAspectRatio))
+        image = image_reader.read()
+        if stopwatch:
+            stopwatch.lap('decode')
+            profiler.record('preview', self.path, width=image.width(), height=image.height(), **stopwatch.total())
+        self.signals.preview_loaded.emit(self.path, image, image_size)
+
+
+class ImageLoader(QObject):
+    """Decode images in a thread pool and prefetch the neighbors of the displayed image"""
+
+    image_loaded = Signal(str, QImage, int)
+    preview_loaded = Signal(str, QImage, QSize)
+
+    def __init__(self, parent=None, prefetch_next=2, prefetch_previous=1, cache_size=512 * 1024 * 1024):
+        super(ImageLoader, self).__init__(parent)
+        self.prefetch_next = prefetch_next
+        self.prefetch_previous = prefetch_previous
+        self.cache = ImageCache(cache_size)
+        self.kinds = {}  # path -> kind of the images that are not decoded by the loader
+        self.pending = {}  # queued or running tasks by path
+        self.previews = {}  # queued or running preview tasks by path
+
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(max(2, QThread.idealThreadCount() - 1))
+
+        self.signals = ImageLoaderSignals(self)
+        self.signals.loaded.connect(self.on_loaded)
+        self.signals.preview_loaded.connect(self.on_preview_loaded)
+
+    def image(self, path):
+        """return the decoded image if it is available
+
+        Args:
+            path (string): image path
+
+        Returns:
+            tuple: (QImage, kind) or None if the image is not decoded yet
+        """
+        if path in self.kinds:
+            return QImage(), self.kinds[path]
+        image = self.cache.get(path)
+        if image is not None:
+            return image, STILL
+        return None
+
+    def load(self, path, priority=1):
+        """decode an image in background, image_loaded is emitted when it is done
+
+        Args:
+            path (string): image path
+            priority (int): thread pool priority, the displayed image goes before prefetched ones
+        """
+        if path in self.pending or path in self.kinds or path in self.cache:
+            return
+        task = ImageLoaderTask(path, self.signals)
+        task.setAutoDelete(False)
+        self.pending[path] = task
+        self.thread_pool.start(task, priority)
+
+    def load_preview(self, path, size):
+        """decode an image at a reduced size before its full decode, preview_loaded is emitted when it is done
+
+        Args:
+            path (string): image path
+            size (QSize): size the preview must fit in
+        """
+        for preview_path, task in list(self.previews.items()):
+            if preview_path != path and self.thread_pool.tryTake(task):
+                del self.previews[preview_path]
+        if path in self.previews or path in self.kinds or path in self.cache:
+            return
+        task = PreviewTask(path, size, self.signals)
+        task.setAutoDelete(False)
+        self.previews[path] = task
+        self.thread_pool.start(task, 2)
+
+    def prefetch(self, images, index):
+        """decode the next and previous images, queued decodes out of the window are cancelled
+
+        Args:
+            images (list): list of image path
+            index (int): index of the displayed image
+        """
+        start = max(0, index - self.prefetch_previous)
+        window = images[start:index + self.prefetch_next + 1]
+
+        for path, task in list(self.pending.items()):
+            if path not in window and self.thread_pool.tryTake(task):
+                del self.pending[path]
+
+        for path in images[index + 1:index + self.prefetch_next + 1]:
+            self.load(path, 0)
+        for path in reversed(images[start:index]):
+            self.load(path, 0)
+
+    def clear(self):
+        """cancel queued decodes, decoded images stay in the cache"""
+        for tasks in (self.pending, self.previews):
+            for path, task in list(tasks.items()):
+                if self.thread_pool.tryTake(task):
+                    del tasks[path]
+        self.kinds.clear()
+
+    @Slot(str, QImage, int, object)
+    def on_loaded(self, path, image, kind, key):
+        if self.pending.pop(path, None) is None:
+            # cancelled meanwhile
+            return
+        if kind != STILL:
+            self.kinds[path] = kind
+        elif not image.isNull():
+            self.cache.put(path, image, key)
+        self.image_loaded.emit(path, image, kind)
+
+    @Slot(str, QImage, QSize)
+    def on_preview_loaded(self, path, image, image_size):
+        if self.previews.pop(path, None) is None or image.isNull():
+            return
+        self.preview_loaded.emit(path, image, image_size)
@@ -0,0 +1,175 @@
+import os
+import shutil
+import struct
+import tempfile
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal, Slot
+from PySide6.QtGui import QImage, QImageReader, QImageWriter, QTransform
+from exif import ORIENTATION_MATRICES, read_exif, write_orientation
+
+# luminance quantization table of the JPEG standard, used by libjpeg at quality 50
+STANDARD_LUMINANCE_TABLE = (
+    16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99,
+)
+
+
+def jpeg_quality(path):
+    """estimate the quality a JPEG file was saved with from its luminance quantization table
+
+    Args:
+        path (string): JPEG file path
+
+    Returns:
+        int: quality from 1 to 100, -1 if it cannot be estimated
+    """
+    try:
+        with open(path, 'rb') as file:
+            if file.read(2) != b'\xff\xd8':
+                return -1
+            while True:
+                marker = file.read(4)
+                if len(marker) < 4 or marker[0] != 0xff or marker[1] in (0xd9, 0xda):
+                    return -1
+                length = struct.unpack('>H', marker[2:])[0]
+                if marker[1] != 0xdb:
+                    file.seek(length - 2, 1)
+                    continue
+                data = file.read(length - 2)
+                if not data or data[0] != 0:
+                    # 16 bits or chrominance table first
+                    return -1
+                table = data[1:65]
+                break
+    except (OSError, struct.error):
+        return -1
+
+    # libjpeg scales the standard table by 5000 / quality below 50 and 200 - 2 * quality above
+    scale = sum(table) * 100 / sum(STANDARD_LUMINANCE_TABLE)
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    return max(1, min(100, round(quality)))
+
+
+class SaveSignals(QObject):
+    saved = Signal(str, QImage, int)
+    failed = Signal(str, str)
+
+
+class SaveTask(QRunnable):
+    def __init__(self, path, image, orientation, signals):
+        """
+        Args:
+            path (string): image path
+            image (QImage): pixels of the file, as decoded without orientation, null if the file is read again
+            orientation (int): Exif orientation the image is displayed with
+            signals (SaveSignals): signals
+        """
+        super(SaveTask, self).__init__()
+        self.path = path
+        self.image = image
+        self.orientation = orientation
+        self.signals = signals
+
+    def run(self):
+        """save the orientation, only the Exif block of a JPEG file is written, other formats are encoded again"""
+        try:
+            exif = read_exif(self.path)
+            if self.orientation == (exif.orientation if exif else 1):
+                self.signals.saved.emit(self.path, QImage(), self.orientation)
+                return
+
+            image_reader = QImageReader(self.path)
+            image_format = bytes(image_reader.format())
+            if image_format == b'jpeg' and write_orientation(self.path, self.orientation):
+                self.signals.saved.emit(self.path, QImage(), self.orientation)
+                return
+
+            image = self.image
+            if image.isNull() or image.size() != image_reader.size():
+                # not decoded yet, or decoded at a reduced size
+                image = image_reader.read()
+                if image.isNull():
+                    raise OSError(image_reader.errorString())
+            self.image = None
+            image = image.transformed(QTransform(*ORIENTATION_MATRICES[self.orientation], 0, 0))
+            self.write(image, image_format)
+        except OSError as e:
+            self.signals.failed.emit(self.path, str(e))
+            return
+        except Exception as e:
+            # reported all the same, the file would stay pending and could not be saved again
+            self.signals.failed.emit(self.path, '{0}: {1}'.format(type(e).__name__, e))
+            return
+        self.signals.saved.emit(self.path, image, self.orientation)
+
+    def write(self, image, image_format):
+        """write the image in the format of the file, through a temporary file renamed over it
+
+        A crash while writing leaves the original file untouched.
+        """
+        if image_format not in [bytes(format) for format in QImageWriter.supportedImageFormats()]:
+            raise OSError('The {0} format cannot be written'.format(image_format.decode('utf-8') or 'file'))
+
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', prefix='.', suffix='.tmp')
+        os.close(descriptor)
+        try:
+            image_writer = QImageWriter(temp_path, image_format)
+            if image_format == b'jpeg':
+                image_writer.setQuality(jpeg_quality(self.path))
+                image_writer.setOptimizedWrite(True)
+            if not image_writer.write(image):
+                raise OSError(image_writer.errorString())
+            shutil.copymode(self.path, temp_path)
+            os.replace(temp_path, self.path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+
+class ImageSaver(QObject):
+    """Save images in a worker thread, one file at a time"""
+
+    saved = Signal(str, QImage, int)
+    failed = Signal(str, str)
+
+    def __init__(self, parent=None):
+        super(ImageSaver, self).__init__(parent)
+        self.pending = {}  # path -> queued or running task
+
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+
+        self.signals = SaveSignals(self)
+        self.signals.saved.connect(self.on_saved)
+        self.signals.failed.connect(self.on_failed)
+
+    def save(self, path, image, orientation):
+        """save an image in background
+
+        Args:
+            path (string): image path
+            image (QImage): pixels of the file, as decoded without orientation, null if the file is read again
+            orientation (int): Exif orientation the image is displayed with
+
+        Returns:
+            boolean: False if the file is already being saved
+        """
+        if path in self.pending:
+            return False
+        task = SaveTask(path, image, orientation, self.signals)
+        task.setAutoDelete(False)
+        self.pending[path] = task
+        self.thread_pool.start(task)
+        return True
+
+    @Slot(str, QImage, int)
+    def on_saved(self, path, image, orientation):
+        self.pending.pop(path, None)
+        self.saved.emit(path, image, orientation)
+
+    @Slot(str, str)
+    def on_failed(self, path, error):
+        self.pending.pop(path, None)
+        self.failed.emit(path, error)
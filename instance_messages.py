@@ -0,0 +1,98 @@
+import json
+import os
+import socket
+import struct
+
+# commands sent to the running instance, as {'command': ..., ...}
+OPEN = 'open'  # 'paths': list of file paths, the first one is displayed, several files are the image list
+NEXT = 'next'
+PREVIOUS = 'previous'
+GOTO = 'goto'  # 'index': index in the image list
+LIBRARY = 'library'  # 'path': directory whose whole tree is browsed
+
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+
+def encode_message(message):
+    """return a message as a frame: its length on 4 bytes, big-endian, then its UTF-8 JSON encoding
+
+    Args:
+        message (dict): command and its arguments
+    """
+    data = json.dumps(message).encode('utf-8')
+    return struct.pack('>I', len(data)) + data
+
+
+def decode_messages(buffer):
+    """remove the complete frames from the start of a buffer and return their messages
+
+    Args:
+        buffer (bytearray): data received, an incomplete frame is left in it
+
+    Returns:
+        list: messages, the frames that are not a JSON object are dropped
+
+    Raises:
+        ValueError: a frame is larger than MAX_MESSAGE_SIZE
+    """
+    messages = []
+    while len(buffer) >= 4:
+        length = struct.unpack('>I', buffer[:4])[0]
+        if length > MAX_MESSAGE_SIZE:
+            raise ValueError('Message of {0} bytes'.format(length))
+        if len(buffer) < 4 + length:
+            break
+        data = bytes(buffer[4:4 + length])
+        del buffer[:4 + length]
+        try:
+            message = json.loads(data.decode('utf-8'))
+        except ValueError:
+            continue
+        if isinstance(message, dict):
+            messages.append(message)
+    return messages
+
+
+def server_path(server_name):
+    """return the socket file QLocalServer listens on for a name, on Unix"""
+    # QDir.tempPath(): TMPDIR or /tmp, symbolic links resolved
+    return os.path.join(os.path.realpath(os.environ.get('TMPDIR') or '/tmp'), server_name)
+
+
+def send_messages(server_name, messages, timeout=1000):
+    """send messages to the running instance, without starting Qt on Unix
+
+    On Unix the socket of the QLocalServer is a Unix domain socket, it is reached with the socket
+    module and this process exits before Qt is even imported. Elsewhere (named pipes on Windows)
+    QLocalSocket is used, QtNetwork is loaded but not the GUI modules.
+
+    Args:
+        server_name (string): name the running instance listens on
+        messages (list): commands, an empty list only activates the running window
+        timeout (int): milliseconds to wait for the connection and the writes
+
+    Returns:
+        boolean: False if no instance is running
+    """
+    data = b''.join(encode_message(message) for message in messages)
+    if hasattr(socket, 'AF_UNIX'):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.settimeout(timeout / 1000)
+                client.connect(server_path(server_name))
+                client.sendall(data)
+        except OSError:
+            return False
+        return True
+
+    from PySide6.QtNetwork import QLocalSocket
+    client = QLocalSocket()
+    client.connectToServer(server_name)
+    if not client.waitForConnected(timeout):
+        return False
+    client.write(data)
+    while client.bytesToWrite():
+        if not client.waitForBytesWritten(timeout):
+            break
+    client.disconnectFromServer()
+    return True
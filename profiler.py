@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+
+from PySide6.QtCore import QObject, Signal
+
+
+class Stopwatch:
+    """Durations of the consecutive stages of a task, in ms"""
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.fields = {}  # stage + '_ms' -> duration, and other fields of the record
+
+    def lap(self, stage):
+        """record the time since the previous stage
+
+        Args:
+            stage (string): stage name, as 'decode'
+        """
+        now = time.perf_counter()
+        self.fields[stage + '_ms'] = round((now - self.last) * 1000, 2)
+        self.last = now
+
+    def total(self):
+        """record the time since the stopwatch was started, as total_ms"""
+        self.fields['total_ms'] = round((time.perf_counter() - self.start) * 1000, 2)
+        return self.fields
+
+
+class Profiler(QObject):
+    """Opt-in timings of the display and thumbnail stages
+
+    Once enabled, each record is written as a JSON object on a line of the log file: the time, the
+    event ('display', 'decode', 'preview', 'scale', 'paint' or 'thumbnail'), the image path and the
+    duration of each stage in ms. Records can be made from any thread. Until then, recording does
+    nothing and the callers skip their measures.
+    """
+
+    recorded = Signal(object)  # record dict
+
+    def __init__(self):
+        super(Profiler, self).__init__()
+        self.enabled = False
+        self.path = None
+        self.file = None
+        self.lock = threading.Lock()
+
+    def enable(self, path):
+        """record from now on
+
+        Args:
+            path (string): log file, records are appended to it
+
+        Raises:
+            OSError: the log file cannot be opened
+        """
+        self.file = open(path, 'a', encoding='utf-8')
+        self.path = path
+        self.enabled = True
+
+    def record(self, event, path, **fields):
+        """write a record and emit it
+
+        Args:
+            event (string): stage or pipeline timed
+            path (string): image path
+            fields: durations in ms, named stage + '_ms', and other values
+        """
+        if not self.enabled:
+            return
+        record = {'time': round(time.time(), 3), 'event': event, 'path': path}
+        record.update(fields)
+        line = json.dumps(record)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+        self.recorded.emit(record)
+
+
+# shared by the window and the worker tasks
+profiler = Profiler()
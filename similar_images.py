@@ -0,0 +1,312 @@
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+
+from PySide6.QtCore import QObject, QRunnable, QStandardPaths, QThreadPool, Qt, Signal, Slot
+from PySide6.QtGui import QImage, QImageReader
+
+
+def image_hash(path):
+    """return the difference hash (dHash) of an image
+
+    The image is decoded at a reduced size, reduced to 9x8 gray pixels, and each bit tells whether a
+    pixel is brighter than its right neighbor. Resized, re-encoded or slightly edited copies get
+    hashes that differ by a few bits.
+
+    Args:
+        path (string): image path
+
+    Returns:
+        int: 64 bits hash, None if the image cannot be decoded
+    """
+    image_reader = QImageReader(path)
+    size = image_reader.size()
+    if size.isValid():
+        image_reader.setScaledSize(size.scaled(64, 64, Qt.KeepAspectRatioByExpanding))
+    image = image_reader.read()
+    if image.isNull():
+        return None
+    image = image.scaled(9, 8, Qt.IgnoreAspectRatio, Qt.SmoothTransformation).convertToFormat(
+        QImage.Format_Grayscale8)
+
+    bits = 0
+    for y in range(8):
+        row = [image.pixel(x, y) & 0xff for x in range(9)]
+        for x in range(8):
+            bits = bits << 1 | (row[x] > row[x + 1])
+    return bits
+
+
+def hash_files(files):
+    """return [(path, mtime, size, hash)], run in the worker processes
+
+    Args:
+        files (list): (path, mtime, size)
+    """
+    return [(path, mtime, size, image_hash(path)) for path, mtime, size in files]
+
+
+class HashStore:
+    """Image hashes persisted per folder, valid while the modification time and the size of the file
+    do not change
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.path.join(QStandardPaths.writableLocation(QStandardPaths.CacheLocation), 'hashes')
+        self.directory = directory
+
+    def path(self, folder):
+        return os.path.join(self.directory, hashlib.md5(os.path.abspath(folder).encode('utf-8')).hexdigest() + '.json')
+
+    def load(self, folder):
+        """return {name: [mtime, size, hash]} of a folder"""
+        try:
+            with open(self.path(folder), encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, folder, hashes):
+        """write the hashes of a folder, through a temporary file renamed over the previous one"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                json.dump(hashes, file)
+            os.replace(temp_path, self.path(folder))
+        except OSError:
+            pass
+
+
+def chunk_flips(max_distance):
+    """return the masks of the 16 bits chunk values within max_distance // 4 bits of a chunk"""
+    flips = [0]
+    for count in range(1, max_distance // 4 + 1):
+        flips += [sum(1 << bit for bit in bits) for bits in itertools.combinations(range(16), count)]
+    return flips
+
+
+def similar_pairs(values, max_distance):
+    """return the (index, other index) of the hashes within max_distance bits, index < other index"""
+    flips = chunk_flips(max_distance)
+    buckets = [{} for _ in range(4)]
+    for index, value in enumerate(values):
+        for chunk in range(4):
+            buckets[chunk].setdefault(value >> (16 * chunk) & 0xffff, []).append(index)
+
+    pairs = set()
+    for index, value in enumerate(values):
+        for chunk in range(4):
+            part = value >> (16 * chunk) & 0xffff
+            bucket = buckets[chunk]
+            for flip in flips:
+                for other in bucket.get(part ^ flip, ()):
+                    if other > index and bin(value ^ values[other]).count('1') <= max_distance:
+                        pairs.add((index, other))
+    return pairs
+
+
+def similar_pairs_numpy(values, max_distance):
+    """same as similar_pairs, the bucket lookups and the distances are computed by arrays
+
+    Raises:
+        ImportError: NumPy is not installed
+    """
+    # imported on first use, it takes longer to import than the viewer to start
+    import numpy
+
+    hashes = numpy.array(values, dtype=numpy.uint64)
+    indexes = numpy.arange(len(values))
+    bit_counts = numpy.array([bin(byte).count('1') for byte in range(256)], dtype=numpy.uint8)
+    pairs = set()
+    for chunk in range(4):
+        keys = ((hashes >> numpy.uint64(16 * chunk)) & numpy.uint64(0xffff)).astype(numpy.int64)
+        order = numpy.argsort(keys, kind='stable')
+        # position in order of the first hash of each chunk value
+        bucket_starts = numpy.searchsorted(keys[order], numpy.arange(0x10001))
+        for flip in chunk_flips(max_distance):
+            probes = keys ^ flip
+            starts = bucket_starts[probes]
+            counts = bucket_starts[probes + 1] - starts
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # one row per (hash, hash of the probed bucket)
+            queries = numpy.repeat(indexes, counts)
+            positions = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + numpy.arange(total)
+            others = order[positions]
+            keep = others > queries
+            queries, others = queries[keep], others[keep]
+            distances = bit_counts[(hashes[queries] ^ hashes[others]).view(numpy.uint8)].reshape(-1, 8).sum(axis=1)
+            near = distances <= max_distance
+            pairs.update(zip(queries[near].tolist(), others[near].tolist()))
+    return pairs
+
+
+def group_similar(hashes, max_distance=6):
+    """group the hashes that differ by max_distance bits or less
+
+    Multi-index hashing: the 64 bits are split in 4 chunks of 16 bits. Two hashes within
+    max_distance bits have at least one chunk within max_distance // 4 bits, so only the hashes
+    found in the buckets of the nearby chunk values are compared. NumPy is used if it is installed.
+
+    Args:
+        hashes (dict): path -> hash
+        max_distance (int): maximum number of different bits
+
+    Returns:
+        list: groups of at least two paths, in the order of their first path
+    """
+    paths = list(hashes)
+    values = [hashes[path] for path in paths]
+    try:
+        pairs = similar_pairs_numpy(values, max_distance) if values else set()
+    except ImportError:
+        pairs = similar_pairs(values, max_distance)
+
+    # union-find of the near-duplicates
+    parents = list(range(len(paths)))
+
+    def root(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    for index, other in pairs:
+        parents[root(other)] = root(index)
+
+    groups = {}
+    for index, path in enumerate(paths):
+        groups.setdefault(root(index), []).append(path)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+class SimilarSignals(QObject):
+    progress = Signal(int, int)
+    finished = Signal(int, object)
+
+
+class SimilarTask(QRunnable):
+    CHUNK_SIZE = 64
+
+    def __init__(self, images, generation, max_distance, store, signals):
+        super(SimilarTask, self).__init__()
+        self.images = images
+        self.generation = generation
+        self.max_distance = max_distance
+        self.store = store
+        self.signals = signals
+        self.cancelled = False
+
+    def run(self):
+        hashes = {}
+        missing = []
+        folders = {}
+        for path in self.images:
+            folder, name = os.path.split(path)
+            if folder not in folders:
+                folders[folder] = self.store.load(folder)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stored = folders[folder].get(name)
+            if stored and stored[:2] == [stat.st_mtime_ns, stat.st_size]:
+                if stored[2] is not None:
+                    hashes[path] = stored[2]
+            else:
+                missing.append((path, stat.st_mtime_ns, stat.st_size))
+
+        if missing:
+            chunks = [missing[i:i + self.CHUNK_SIZE] for i in range(0, len(missing), self.CHUNK_SIZE)]
+            done = 0
+            for results in self.hash_chunks(chunks):
+                for path, mtime, size, value in results:
+                    folder, name = os.path.split(path)
+                    folders[folder][name] = [mtime, size, value]
+                    if value is not None:
+                        hashes[path] = value
+                done += len(results)
+                self.signals.progress.emit(done, len(missing))
+            for folder, folder_hashes in folders.items():
+                self.store.save(folder, folder_hashes)
+
+        if not self.cancelled:
+            self.signals.finished.emit(self.generation, group_similar(hashes, self.max_distance))
+
+    def hash_chunks(self, chunks):
+        """yield the hashes of each chunk of files, computed in a process pool
+
+        The files are hashed in this thread if no process can be started.
+        """
+        # imported by the first search rather than at startup
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        done = 0
+        try:
+            # spawn: forking a process running Qt threads is not safe
+            with ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn')) as executor:
+                for results in executor.map(hash_files, chunks):
+                    done += 1
+                    yield results
+                    if self.cancelled:
+                        executor.shutdown(cancel_futures=True)
+                        return
+        except (OSError, RuntimeError):
+            for chunk in chunks[done:]:
+                if self.cancelled:
+                    return
+                yield hash_files(chunk)
+
+
+class SimilarImages(QObject):
+    """Find the near-duplicate images of a list in background
+
+    Hashes are computed in a process pool and stored, a folder already hashed is grouped at once.
+    """
+
+    progress = Signal(int, int)  # images hashed, images to hash
+    finished = Signal(object)  # list of groups of paths
+
+    def __init__(self, parent=None, max_distance=6):
+        super(SimilarImages, self).__init__(parent)
+        self.max_distance = max_distance
+        self.store = HashStore()
+        self.task = None
+        self.generation = 0
+
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+
+        self.signals = SimilarSignals(self)
+        self.signals.progress.connect(self.progress)
+        self.signals.finished.connect(self.on_finished)
+
+    def find(self, images):
+        """group the near-duplicates of a list of images, the previous search is cancelled
+
+        Args:
+            images (list): list of image path
+        """
+        self.cancel()
+        self.task = SimilarTask(list(images), self.generation, self.max_distance, self.store, self.signals)
+        self.task.setAutoDelete(False)
+        self.thread_pool.start(self.task)
+
+    def cancel(self):
+        self.generation += 1
+        if self.task is not None:
+            self.task.cancelled = True
+            self.thread_pool.tryTake(self.task)
+            self.task = None
+
+    @Slot(int, object)
+    def on_finished(self, generation, groups):
+        if generation == self.generation:
+            self.task = None
+            self.finished.emit(groups)
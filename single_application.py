@@ -1,11 +1,12 @@
-from PySide6.QtCore import Signal, QTextStream, Qt
+from PySide6.QtCore import Signal, Qt
 from PySide6.QtWidgets import QApplication
 from PySide6.QtNetwork import QLocalSocket, QLocalServer
+from instance_messages import decode_messages, encode_message
 
 
 class SingleApplication(QApplication):
 
-    message_received = Signal(str)
+    message_received = Signal(object)
 
     def __init__(self, id, *argv):
 
@@ -19,16 +20,15 @@ class SingleApplication(QApplication):
         self.out_socket.connectToServer(self.id)
         self.is_running = self.out_socket.waitForConnected()
 
-        if self.is_running:
-            self.out_stream = QTextStream(self.out_socket)
-        else:
+        if not self.is_running:
             # No, there isn't.
             self.out_socket = None
-            self.out_stream = None
-            self.in_socket = None
-            self.in_stream = None
+            self.in_sockets = {}  # connected client -> data received and not decoded yet
             self.server = QLocalServer()
-            self.server.listen(self.id)
+            if not self.server.listen(self.id):
+                # socket file left by an instance that crashed
+                QLocalServer.removeServer(self.id)
+                self.server.listen(self.id)
             self.server.newConnection.connect(self.on_new_connection)
 
     def get_is_running(self):
@@ -56,27 +56,55 @@ class SingleApplication(QApplication):
         self.activation_window.activateWindow()
 
     def send_message(self, msg):
-        if not self.out_stream:
+        """send a message to the running instance
+
+        Args:
+            msg (dict): command and its arguments, see instance_messages
+
+        Returns:
+            boolean: True once the message is written
+        """
+        if not self.out_socket:
             return False
-        self.out_stream << msg << '\n'
-        self.out_stream.flush()
-        return self.out_socket.waitForBytesWritten()
+        self.out_socket.write(encode_message(msg))
+        while self.out_socket.bytesToWrite():
+            if not self.out_socket.waitForBytesWritten():
+                return False
+        return True
 
     def on_new_connection(self):
-        if self.in_socket:
-            self.in_socket.readyRead.disconnect(self.on_ready_read)
-        self.in_socket = self.server.nextPendingConnection()
-        if not self.in_socket:
-            return
-        self.in_stream = QTextStream(self.in_socket)
-        self.in_socket.readyRead.connect(self.on_ready_read)
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self.in_sockets[socket] = bytearray()
+            socket.readyRead.connect(self.on_ready_read)
+            socket.disconnected.connect(self.on_disconnected)
+            # data may have arrived with the connection
+            self.read_messages(socket)
         if self.activate_on_message:
             self.activate_Window()
 
     def on_ready_read(self):
-        while True:
-            msg = self.in_stream.readLine()
-            if not msg:
-                break
-            
+        self.read_messages(self.sender())
+
+    def on_disconnected(self):
+        socket = self.sender()
+        self.read_messages(socket)
+        self.in_sockets.pop(socket, None)
+        socket.deleteLater()
+
+    def read_messages(self, socket):
+        """emit the messages received on a client connection"""
+        buffer = self.in_sockets.get(socket)
+        if buffer is None:
+            return
+        buffer += socket.readAll().data()
+        try:
+            messages = decode_messages(buffer)
+        except ValueError:
+            # not a client of ours, it is dropped
+            del self.in_sockets[socket]
+            socket.abort()
+            socket.deleteLater()
+            return
+        for msg in messages:
             self.message_received.emit(msg)
@@ -0,0 +1,327 @@
+import functools
+import os
+import re
+import time
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal, Slot
+from exif import read_exif
+
+# orders of the image list
+NATURAL = 'natural'  # file names, numbers by value: IMG_2.jpg before IMG_10.jpg
+MODIFIED = 'modified'  # modification time
+DATE = 'date'  # Exif capture date, the modification time if the file has none
+SIZE = 'size'  # file size
+ORDERS = (NATURAL, MODIFIED, DATE, SIZE)
+
+DIGITS = re.compile(r'(\d+)')
+
+
+def natural_parts(text):
+    """return the texts and numbers of a text, a text is never compared with a number as they alternate"""
+    parts = DIGITS.split(text.casefold())
+    parts[1::2] = map(int, parts[1::2])
+    return tuple(parts)
+
+
+@functools.lru_cache(maxsize=4096)
+def directory_key(directory):
+    """return the natural key of a directory, computed once for all its files
+
+    The components are compared one by one, a directory goes right after its parent: this is the
+    order of a depth-first walk visiting the subdirectories in natural order.
+    """
+    return tuple((natural_parts(name), name) for name in directory.split(os.sep))
+
+
+def natural_key(path):
+    """return the key sorting paths as a person would, the numbers are compared by value
+
+    The files of a directory go before the ones of its subdirectories.
+
+    Args:
+        path (string): file path
+    """
+    directory, name = os.path.split(path)
+    return directory_key(directory), natural_parts(name), path
+
+
+def file_key(order, path, info):
+    """return the sort key of a file for an order other than NATURAL
+
+    Args:
+        order (string): MODIFIED, DATE or SIZE
+        path (string): file path
+        info (FileInfo): catalog metadata of the file, the file is read if None
+    """
+    if info is not None and info.mtime_ns is not None:
+        mtime_ns, size, date = info.mtime_ns, info.size, info.date
+    else:
+        try:
+            stat = os.stat(path)
+            mtime_ns, size = stat.st_mtime_ns, stat.st_size
+        except OSError:
+            mtime_ns, size = 0, 0
+        date = None
+        if order == DATE:
+            exif = read_exif(path)
+            date = exif.date_time_original if exif else None
+    if order == MODIFIED:
+        return mtime_ns, path
+    if order == SIZE:
+        return size, path
+    # the Exif date format, an image without capture date is sorted by its modification time
+    return date or time.strftime('%Y:%m:%d %H:%M:%S', time.localtime(mtime_ns / 1e9)), path
+
+
+class ImageSorter:
+    """Image list sorted in several orders
+
+    The images are given in natural order, another order is sorted in background by a BackgroundSorter
+    the first time it is asked, then kept. The key of a file is computed once per order, the files
+    added or removed are placed by a binary search in each kept list: neither a change of the folder
+    nor going back to an order sorts the list again.
+    """
+
+    def __init__(self):
+        self.keys = {order: {} for order in ORDERS}  # order -> path -> key
+        self.lists = {NATURAL: []}  # order -> images sorted in this order
+        self.version = 0  # changed with the images or their keys, a list sorted before is dropped
+        self.last_indexes = (None, None, {})  # version, order, path -> index of the last order listed
+
+    def clear(self):
+        for keys in self.keys.values():
+            keys.clear()
+        self.lists = {NATURAL: []}
+        self.version += 1
+
+    def set_images(self, images):
+        """replace the images, the keys already computed are kept
+
+        Args:
+            images (list): list of image path, in natural order
+        """
+        self.lists = {NATURAL: list(images)}
+        self.version += 1
+
+    def extend(self, images):
+        """append images that go after the listed ones in natural order, as found by a tree walk
+
+        The other orders are sorted again when they are asked.
+
+        Args:
+            images (list): list of image path, in natural order
+        """
+        self.lists = {NATURAL: self.lists[NATURAL]}
+        self.lists[NATURAL].extend(images)
+        self.version += 1
+
+    def images(self, order):
+        """return the images sorted in an order, the list is kept and must not be modified
+
+        Args:
+            order (string): NATURAL, MODIFIED, DATE or SIZE
+
+        Returns:
+            list: list of image path, None if the order is not sorted yet
+        """
+        return self.lists.get(order)
+
+    def indexes(self, order):
+        """return the positions of the images in a kept order, they are kept for the last order asked
+        until the images change
+
+        Args:
+            order (string): NATURAL, MODIFIED, DATE or SIZE
+
+        Returns:
+            dict: path -> index, must not be modified
+        """
+        version, last_order, indexes = self.last_indexes
+        if version != self.version or last_order != order:
+            images = self.lists[order]
+            indexes = dict(zip(images, range(len(images))))
+            self.last_indexes = (self.version, order, indexes)
+        return indexes
+
+    def set_sorted(self, order, images, keys, version, indexes=None):
+        """keep the images sorted in an order by a BackgroundSorter
+
+        Args:
+            order (string): MODIFIED, DATE or SIZE
+            images (list): the images, sorted by their keys
+            keys (dict): path -> key computed by file_key
+            version (int): version of the images that were sorted
+            indexes (dict): path -> index in images, computed with them
+
+        Returns:
+            boolean: False if the images or their keys changed since, the list is dropped
+        """
+        # the keys changed meanwhile are kept, the others are valid whatever the list
+        merged = dict(keys)
+        merged.update(self.keys[order])
+        self.keys[order] = merged
+        if version != self.version:
+            return False
+        self.lists[order] = images
+        if indexes is not None:
+            self.last_indexes = (version, order, indexes)
+        return True
+
+    def key(self, order, path, metadata):
+        keys = self.keys[order]
+        key = keys.get(path)
+        if key is None:
+            key = keys[path] = natural_key(path) if order == NATURAL else file_key(order, path, metadata.get(path))
+        return key
+
+    def position(self, order, key, metadata):
+        """return the index of the first image whose key is not lower than key, in the list of an order"""
+        images = self.lists[order]
+        low, high = 0, len(images)
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(order, images[middle], metadata) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def add(self, paths, metadata):
+        """insert images in each kept order
+
+        Args:
+            paths (iterable): image paths, not listed yet
+            metadata (dict): path -> FileInfo, the files missing are read
+        """
+        for path in paths:
+            for order, images in self.lists.items():
+                images.insert(self.position(order, self.key(order, path, metadata), metadata), path)
+            self.version += 1
+
+    def remove(self, paths, metadata):
+        """remove images from each kept order
+
+        Args:
+            paths (iterable): listed image paths
+            metadata (dict): path -> FileInfo
+        """
+        for path in paths:
+            for order, images in self.lists.items():
+                self.discard(order, images, path, metadata)
+                self.keys[order].pop(path, None)
+            self.version += 1
+
+    def discard(self, order, images, path, metadata):
+        index = self.position(order, self.key(order, path, metadata), metadata)
+        if index < len(images) and images[index] == path:
+            del images[index]
+
+    def update(self, metadata):
+        """move the images whose key changed with their metadata
+
+        Args:
+            metadata (dict): path -> FileInfo of the files read again
+
+        Returns:
+            set: orders whose list changed
+        """
+        changed = set()
+        for order in (MODIFIED, DATE, SIZE):
+            keys = self.keys[order]
+            images = self.lists.get(order)
+            for path, info in metadata.items():
+                key = keys.get(path)
+                if key is None:
+                    continue
+                new_key = file_key(order, path, info)
+                if new_key == key:
+                    continue
+                if images is not None:
+                    self.discard(order, images, path, metadata)
+                keys[path] = new_key
+                self.version += 1
+                if images is not None:
+                    images.insert(self.position(order, new_key, metadata), path)
+                    changed.add(order)
+        return changed
+
+
+class SortSignals(QObject):
+    sorted = Signal(int, str, object, object, object, int)
+
+
+class SortTask(QRunnable):
+    def __init__(self, order, images, keys, metadata, version, generation, signals):
+        super(SortTask, self).__init__()
+        self.order = order
+        self.images = images
+        self.keys = keys
+        self.metadata = metadata
+        self.version = version
+        self.generation = generation
+        self.signals = signals
+        self.cancelled = False
+
+    def run(self):
+        """compute the keys that are not known yet, a file missing from the metadata is read, then sort"""
+        keys = {}
+        for path in self.images:
+            if self.cancelled:
+                return
+            key = self.keys.get(path)
+            keys[path] = key if key is not None else file_key(self.order, path, self.metadata.get(path))
+        images = sorted(self.images, key=keys.__getitem__)
+        # the positions of a large list take as long to index as to sort
+        indexes = dict(zip(images, range(len(images))))
+        self.signals.sorted.emit(self.generation, self.order, images, keys, indexes, self.version)
+
+
+class BackgroundSorter(QObject):
+    """Sort the images of an ImageSorter in an order in a worker thread
+
+    The files are read there when their metadata is missing, as for the capture date, so sorting a
+    large folder never blocks the window. Only the result of the last sort started is delivered.
+    """
+
+    sorted = Signal(str, object, object, object, int)  # order, sorted images, path -> key, path -> index, version
+
+    def __init__(self, parent=None):
+        super(BackgroundSorter, self).__init__(parent)
+        self.task = None
+        self.generation = 0
+
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+
+        self.signals = SortSignals(self)
+        self.signals.sorted.connect(self.on_sorted)
+
+    def sort(self, order, image_sorter, metadata):
+        """sort the images in background, the previous sort is cancelled unless it is the same
+
+        Args:
+            order (string): MODIFIED, DATE or SIZE
+            image_sorter (ImageSorter): images in natural order and keys already computed
+            metadata (dict): path -> FileInfo, the files missing are read
+        """
+        if self.task is not None and self.task.order == order and self.task.version == image_sorter.version:
+            return
+        self.cancel()
+        # the keys and the metadata are only looked up, the main thread may add to them meanwhile
+        self.task = SortTask(order, list(image_sorter.lists[NATURAL]), image_sorter.keys[order], metadata,
+                             image_sorter.version, self.generation, self.signals)
+        self.task.setAutoDelete(False)
+        self.thread_pool.start(self.task)
+
+    def cancel(self):
+        self.generation += 1
+        if self.task is not None:
+            self.task.cancelled = True
+            self.thread_pool.tryTake(self.task)
+            self.task = None
+
+    @Slot(int, str, object, object, object, int)
+    def on_sorted(self, generation, order, images, keys, indexes, version):
+        if generation == self.generation:
+            self.task = None
+            self.sorted.emit(order, images, keys, indexes, version)
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PySide6.QtWidgets import QApplication  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def cache_home(tmp_path, monkeypatch):
+    """thumbnails are written in a temporary cache rather than in ~/.cache"""
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
@@ -0,0 +1,24 @@
+import os
+
+from catalog import Catalog
+from directory_scanner import scan_directory
+
+
+def test_listing_reused_once_folder_is_old(app, tmp_path):
+    folder = tmp_path / 'images'
+    folder.mkdir()
+    (folder / 'a.jpg').write_bytes(b'')
+    catalog = Catalog(str(tmp_path / 'catalog.sqlite'))
+    extensions = {'.jpg'}
+
+    # listed right after its change: a file of the same timestamp tick could be missed
+    result = scan_directory(str(folder), extensions, catalog)
+    catalog.save_listing(result.directory, result.mtime_ns, result.images, result.listed_ns)
+    assert catalog.listing(str(folder)) is None
+
+    old = result.listed_ns - 10 * Catalog.RACY_NS
+    os.utime(str(folder), ns=(old, old))
+    result = scan_directory(str(folder), extensions, catalog)
+    catalog.save_listing(result.directory, result.mtime_ns, result.images, result.listed_ns)
+    assert catalog.listing(str(folder)) == [str(folder / 'a.jpg')]
+    assert scan_directory(str(folder), extensions, catalog).mtime_ns is None
@@ -0,0 +1,47 @@
+import os
+
+from file_operations import (COPY, MOVE, OVERWRITE, SKIP, ContentHashes, FileOperationSignals,
+                             FileOperationTask)
+
+
+def write(path, content):
+    with open(path, 'wb') as file:
+        file.write(content)
+
+
+def run(operation, files, policy=OVERWRITE):
+    signals = FileOperationSignals()
+    results = []
+    signals.finished.connect(results.append)
+    FileOperationTask(operation, files, policy, ContentHashes(), signals).run()
+    return results[0]
+
+
+def test_move_onto_identical_file(app, tmp_path):
+    src, dst = str(tmp_path / 'a.jpg'), str(tmp_path / 'b.jpg')
+    write(src, b'same')
+    write(dst, b'same')
+    for policy in (OVERWRITE, SKIP):
+        result = run(MOVE, [(src, dst)], policy)
+        assert result.done == [(src, dst)] and not result.skipped and not result.errors
+        assert not os.path.exists(src)
+        assert open(dst, 'rb').read() == b'same'
+        write(src, b'same')
+
+
+def test_copy_onto_identical_file(app, tmp_path):
+    src, dst = str(tmp_path / 'a.jpg'), str(tmp_path / 'b.jpg')
+    write(src, b'same')
+    write(dst, b'same')
+    result = run(COPY, [(src, dst)])
+    assert result.skipped == [src] and not result.done
+    assert os.path.exists(src)
+
+
+def test_move_onto_link_to_source(app, tmp_path):
+    src, dst = str(tmp_path / 'a.jpg'), str(tmp_path / 'b.jpg')
+    write(src, b'content')
+    os.symlink(src, dst)
+    result = run(MOVE, [(src, dst)])
+    assert result.skipped == [src]
+    assert open(src, 'rb').read() == b'content'
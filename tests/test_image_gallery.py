@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QColor, QImage
+
+from image_gallery import ImageGallery
+
+
+def make_images(directory, count):
+    paths = []
+    for number in range(count):
+        image = QImage(160, 120, QImage.Format_RGB32)
+        image.fill(QColor.fromHsv(number * 7 % 360, 200, 200))
+        path = os.path.join(directory, 'img_{0:03}.jpg'.format(number))
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def wait_thumbnails(app, gallery, timeout=10):
+    end = time.monotonic() + timeout
+    while gallery.gallery_model.pending and time.monotonic() < end:
+        app.processEvents()
+
+
+def test_data_never_returns_none(app, cache_home, tmp_path):
+    gallery = ImageGallery(None)
+    gallery.add_images(make_images(str(tmp_path), 3), {})
+    model = gallery.gallery_model
+    roles = [Qt.DisplayRole, Qt.DecorationRole, Qt.ToolTipRole, Qt.StatusTipRole, Qt.FontRole, Qt.CheckStateRole,
+             Qt.UserRole, Qt.UserRole + 1]
+    for index in [model.index(row) for row in range(3)] + [model.index(5), model.index(-1)]:
+        for role in roles:
+            assert model.data(index, role) is not None
+    # a thumbnail being loaded is a null pixmap
+    assert model.data(model.index(0), Qt.DecorationRole).isNull()
+    wait_thumbnails(app, gallery)
+    assert not model.data(model.index(0), Qt.DecorationRole).isNull()
+
+
+def test_scroll_gallery(app, cache_home, tmp_path):
+    gallery = ImageGallery(None)
+    gallery.resize(800, 600)
+    gallery.show()
+    gallery.add_images(make_images(str(tmp_path), 200))
+    app.processEvents()
+    bar = gallery.verticalScrollBar()
+    assert bar.maximum() > 0
+    none_references = sys.getrefcount(None)
+    for _ in range(6):
+        for value in list(range(0, bar.maximum() + 1, 40)) + list(range(bar.maximum(), -1, -40)):
+            bar.setValue(value)
+            gallery.viewport().repaint()
+            app.processEvents()
+        wait_thumbnails(app, gallery)
+    # the views ask the model thousands of times, no reference to None may be lost on the way
+    assert sys.getrefcount(None) > none_references - 500
+    assert gallery.gallery_model.misses > 0
+    gallery.close()
@@ -0,0 +1,24 @@
+import time
+
+from PySide6.QtGui import QColor, QImage
+
+from image_saver import ImageSaver
+
+
+def test_failed_save_is_not_pending(app, tmp_path):
+    path = str(tmp_path / 'image.png')
+    image = QImage(32, 16, QImage.Format_RGB32)
+    image.fill(QColor('red'))
+    image.save(path)
+    saver = ImageSaver()
+    failures = []
+    saver.failed.connect(lambda path, error: failures.append(path))
+
+    # no such Exif orientation, the task raises an error that is not an OSError
+    assert saver.save(path, QImage(), 9)
+    end = time.monotonic() + 10
+    while saver.pending and time.monotonic() < end:
+        app.processEvents()
+    assert not saver.pending
+    assert failures == [path]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['image.png']
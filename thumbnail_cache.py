@@ -0,0 +1,227 @@
+import hashlib
+import os
+import struct
+import tempfile
+
+from urllib.parse import quote
+from PySide6.QtCore import QBuffer, QByteArray, QSize, QStandardPaths, Qt
+from PySide6.QtGui import QImage, QImageReader, QTransform
+from exif import ORIENTATION_MATRICES, read_exif
+
+
+def read_png_text(path):
+    """read the tEXt chunks of a PNG file without decoding its pixels
+
+    QImageReader.text cannot be used, it splits the keys on ':' and the thumbnail keys contain '::'.
+
+    Args:
+        path (string): PNG file path
+
+    Returns:
+        dict: text chunks by key
+    """
+    text = {}
+    with open(path, 'rb') as file:
+        if file.read(8) != b'\x89PNG\r\n\x1a\n':
+            return text
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type in (b'IDAT', b'IEND'):
+                break
+            data = file.read(length + 4)[:length]  # skip crc
+            if chunk_type == b'tEXt' and b'\x00' in data:
+                key, value = data.split(b'\x00', 1)
+                text[key.decode('latin-1')] = value.decode('latin-1')
+    return text
+
+
+class ThumbnailCache:
+    """Persistent thumbnail store following the freedesktop thumbnail specification
+
+    Thumbnails are PNG files named after the md5 of the file URI, in ~/.cache/thumbnails/<size>.
+    The Thumb::URI and Thumb::MTime text chunks tell whether a thumbnail is still valid, so the
+    store is shared with the file managers and the other viewers of the desktop.
+    """
+
+    # thumbnail directories and their maximum size
+    SIZES = (('normal', 128), ('large', 256), ('x-large', 512), ('xx-large', 1024))
+
+    def __init__(self, size=256, directory=None):
+        if directory is None:
+            directory = os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation),
+                                     'thumbnails')
+        self.directory = directory
+        self.flavor, self.size = next(((flavor, max_size) for flavor, max_size in self.SIZES if max_size >= size),
+                                      self.SIZES[-1])
+        self.fail_directory = os.path.join(self.directory, 'fail', 'baloviewer')
+
+    @staticmethod
+    def uri(path):
+        """return the URI of a file as used to name its thumbnail
+
+        Args:
+            path (string): file path
+        """
+        return 'file://' + quote(os.path.abspath(path), safe="/!$&'()*+,;=:@")
+
+    def thumbnail_path(self, path, directory=None):
+        """return the path of the thumbnail of a file
+
+        Args:
+            path (string): file path
+            directory (string): thumbnail directory, the one of the cache size if None
+        """
+        name = hashlib.md5(self.uri(path).encode('utf-8')).hexdigest() + '.png'
+        return os.path.join(directory or os.path.join(self.directory, self.flavor), name)
+
+    def load(self, path):
+        """return the cached thumbnail of a file if it is up to date
+
+        Args:
+            path (string): file path
+
+        Returns:
+            QImage: thumbnail, null if it failed before, None if it is missing or stale
+        """
+        try:
+            mtime = str(int(os.stat(path).st_mtime))
+        except OSError:
+            return None
+
+        for directory in (None, self.fail_directory):
+            thumbnail_path = self.thumbnail_path(path, directory)
+            if not os.path.isfile(thumbnail_path):
+                continue
+            # text chunks are read without decoding the pixels
+            try:
+                text = read_png_text(thumbnail_path)
+            except OSError:
+                continue
+            if text.get('Thumb::MTime') != mtime or text.get('Thumb::URI') != self.uri(path):
+                continue
+            return QImage() if directory else QImageReader(thumbnail_path, b'png').read()
+        return None
+
+    def save(self, path, image):
+        """store the thumbnail of a file, a null image records a failure
+
+        Args:
+            path (string): file path
+            image (QImage): thumbnail
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+
+        if image.isNull():
+            directory = self.fail_directory
+            image = QImage(1, 1, QImage.Format_ARGB32)
+            image.fill(Qt.transparent)
+        else:
+            directory = os.path.join(self.directory, self.flavor)
+        image.setText('Thumb::URI', self.uri(path))
+        image.setText('Thumb::MTime', str(int(stat.st_mtime)))
+        image.setText('Thumb::Size', str(stat.st_size))
+        image.setText('Software', 'BaloViewer')
+
+        # write a temporary file then rename it, readers never see a partial thumbnail
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix='.png', dir=directory)
+            os.close(fd)
+            if image.save(temp_path, 'PNG'):
+                os.chmod(temp_path, 0o600)
+                os.replace(temp_path, self.thumbnail_path(path, directory))
+            else:
+                os.remove(temp_path)
+        except OSError:
+            pass
+
+    def embedded_thumbnail(self, path, min_size):
+        """return the Exif thumbnail of a JPEG file if it is large enough
+
+        Args:
+            path (string): file path
+            min_size (QSize): size the thumbnail must cover once scaled with the aspect ratio kept
+
+        Returns:
+            QImage: thumbnail or None
+        """
+        exif = read_exif(path)
+        data = exif.thumbnail if exif else None
+        if not data:
+            return None
+
+        buffer = QBuffer()
+        buffer.setData(QByteArray(data))
+        image = QImageReader(buffer, b'jpeg').read()
+        if image.isNull() or image.size().scaled(min_size, Qt.KeepAspectRatio).width() > image.width():
+            return None
+        # the Exif thumbnail is stored like the image, not upright
+        return image.transformed(QTransform(*ORIENTATION_MATRICES[exif.orientation], 0, 0))
+
+    def create(self, path):
+        """decode a file at the thumbnail size
+
+        The decoder scales while decoding, a JPEG file is only partially decoded.
+
+        Args:
+            path (string): file path
+
+        Returns:
+            QImage: thumbnail, null if the file cannot be decoded
+        """
+        image_reader = QImageReader(path)
+        image_reader.setAutoTransform(True)
+        size = image_reader.size()
+        if size.isValid() and (size.width() > self.size or size.height() > self.size):
+            image_reader.setScaledSize(size.scaled(self.size, self.size, Qt.KeepAspectRatio))
+        image = image_reader.read()
+        if image.isNull() or (image.width() <= self.size and image.height() <= self.size):
+            return image
+        # the format cannot report its size before decoding
+        return image.scaled(self.size, self.size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+    def thumbnail(self, path, min_size=None, stopwatch=None):
+        """return the thumbnail of a file
+
+        The stored thumbnail is used if it is up to date, else the Exif thumbnail if it covers min_size.
+        Otherwise a thumbnail is created and stored.
+
+        Args:
+            path (string): file path
+            min_size (QSize): size the thumbnail is displayed at, the stored size if None
+            stopwatch (Stopwatch): times each step and records the source of the thumbnail, while profiling
+
+        Returns:
+            QImage: thumbnail, null if the file cannot be decoded
+        """
+        image = self.load(path)
+        if stopwatch:
+            stopwatch.lap('load')
+        if image is not None:
+            if stopwatch:
+                stopwatch.fields['source'] = 'stored'
+            return image
+
+        # the Exif thumbnail is smaller than the stored ones, it is not shared with the other programs
+        image = self.embedded_thumbnail(path, min_size or QSize(self.size, self.size))
+        if stopwatch:
+            stopwatch.lap('exif')
+        if image is not None:
+            if stopwatch:
+                stopwatch.fields['source'] = 'exif'
+            return image
+
+        image = self.create(path)
+        if stopwatch:
+            stopwatch.lap('create')
+        self.save(path, image)
+        if stopwatch:
+            stopwatch.lap('save')
+            stopwatch.fields['source'] = 'created'
+        return image
@@ -0,0 +1,267 @@
+import math
+
+from collections import OrderedDict
+from PySide6.QtCore import QObject, QRect, QRectF, QRunnable, QSize, QThread, QThreadPool, Signal, Slot
+from PySide6.QtGui import QImage, QImageIOHandler, QImageReader, QPainter, QPixmap
+from PySide6.QtWidgets import QWidget
+
+
+def can_tile(image_reader):
+    """return True if the format decodes a region of the image without decoding the whole image
+
+    Args:
+        image_reader (QImageReader): reader of the image
+    """
+    return (image_reader.supportsOption(QImageIOHandler.ClipRect)
+            and image_reader.supportsOption(QImageIOHandler.ScaledClipRect))
+
+
+def too_large(image_reader):
+    """return True if the image is over the allocation limit of the image readers
+
+    Args:
+        image_reader (QImageReader): reader of the image
+    """
+    size = image_reader.size()
+    limit = QImageReader.allocationLimit() * 1024 * 1024
+    return size.isValid() and limit > 0 and size.width() * size.height() * 4 > limit
+
+
+def needs_tiles(image_reader):
+    """return True if the image is too large to be decoded at once and can be decoded by tiles
+
+    Args:
+        image_reader (QImageReader): reader of the image
+    """
+    return too_large(image_reader) and can_tile(image_reader)
+
+
+def fitting_size(size):
+    """return the largest size with the aspect ratio of an image that is under the allocation limit
+
+    Args:
+        size (QSize): size of the image
+    """
+    scale = math.sqrt(QImageReader.allocationLimit() * 1024 * 1024 / (size.width() * size.height() * 4))
+    return QSize(max(1, int(size.width() * scale)), max(1, int(size.height() * scale)))
+
+
+class TileSignals(QObject):
+    loaded = Signal(object, QImage)
+
+
+class TileTask(QRunnable):
+    def __init__(self, path, key, level_size, rect, signals):
+        """
+        Args:
+            path (string): image path
+            key (tuple): (generation, level, column, row)
+            level_size (QSize): size of the image at the level of the tile
+            rect (QRect): tile rect in level coordinates
+            signals (TileSignals): signals
+        """
+        super(TileTask, self).__init__()
+        self.path = path
+        self.key = key
+        self.level_size = level_size
+        self.rect = rect
+        self.signals = signals
+
+    def run(self):
+        image_reader = QImageReader(self.path)
+        if self.key[1] == 0:
+            image_reader.setClipRect(self.rect)
+        else:
+            # the decoder scales first, a JPEG is decoded at a reduced DCT scale
+            image_reader.setScaledSize(self.level_size)
+            image_reader.setScaledClipRect(self.rect)
+        self.signals.loaded.emit(self.key, image_reader.read())
+
+
+class TiledImage(QWidget):
+    """Display an image too large to be decoded at once
+
+    The widget is resized like the image label. Only the tiles of the exposed region are decoded,
+    at the power of two reduction the closest to the display scale, and kept in a cache whose size
+    depends on the viewport, not on the image.
+    """
+
+    TILE_SIZE = 512
+
+    def __init__(self, parent=None, max_bytes=192 * 1024 * 1024):
+        super(TiledImage, self).__init__(parent)
+        self.path = None
+        self.image_size = QSize()
+        self.generation = 0
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.tiles = OrderedDict()  # (level, column, row) -> QPixmap
+        self.overview = {}  # tiles of the coarsest level, kept to draw something while tiles are decoded
+        self.pending = {}  # (level, column, row) -> task
+
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(max(2, QThread.idealThreadCount() - 1))
+        self.signals = TileSignals(self)
+        self.signals.loaded.connect(self.on_tile_loaded)
+
+    def set_source(self, path, image_size):
+        """display another image
+
+        Args:
+            path (string): image path
+            image_size (QSize): full size of the image
+        """
+        self.clear()
+        self.path = path
+        self.image_size = QSize(image_size)
+        size = self.level_size(self.max_level())
+        for row in range(math.ceil(size.height() / self.TILE_SIZE)):
+            for column in range(math.ceil(size.width() / self.TILE_SIZE)):
+                self.load_tile((self.max_level(), column, row))
+        self.update()
+
+    def clear(self):
+        self.generation += 1
+        for task in self.pending.values():
+            self.thread_pool.tryTake(task)
+        self.pending.clear()
+        self.tiles.clear()
+        self.overview.clear()
+        self.bytes = 0
+        self.path = None
+        self.image_size = QSize()
+
+    def scale(self):
+        """return the display scale: widget pixels per image pixel"""
+        if self.image_size.isEmpty():
+            return 0
+        return self.width() / self.image_size.width()
+
+    def max_level(self):
+        """return the coarsest level, whose image fits in a few tiles"""
+        return max(0, int(math.log2(max(self.image_size.width(), self.image_size.height()) / self.TILE_SIZE)))
+
+    def level(self):
+        """return the level to decode: the image is reduced by 2 ** level"""
+        scale = self.scale()
+        level = int(math.floor(math.log2(1 / scale))) if 0 < scale < 1 else 0
+        return min(level, self.max_level())
+
+    def level_size(self, level):
+        factor = 2 ** level
+        return QSize(math.ceil(self.image_size.width() / factor), math.ceil(self.image_size.height() / factor))
+
+    def tile_rect(self, level, column, row):
+        """return the rect of a tile in level coordinates"""
+        level_rect = QRect(0, 0, self.level_size(level).width(), self.level_size(level).height())
+        return QRect(column * self.TILE_SIZE, row * self.TILE_SIZE, self.TILE_SIZE, self.TILE_SIZE) & level_rect
+
+    def visible_tiles(self, rect, level):
+        """return the tiles of a level covering a rect in widget coordinates"""
+        ratio = self.scale() * 2 ** level  # widget pixels per level pixel
+        size = self.level_size(level)
+        first_column = max(0, int(rect.left() / ratio) // self.TILE_SIZE)
+        last_column = min((size.width() - 1) // self.TILE_SIZE, int(rect.right() / ratio) // self.TILE_SIZE)
+        first_row = max(0, int(rect.top() / ratio) // self.TILE_SIZE)
+        last_row = min((size.height() - 1) // self.TILE_SIZE, int(rect.bottom() / ratio) // self.TILE_SIZE)
+        return [(level, column, row) for row in range(first_row, last_row + 1)
+                for column in range(first_column, last_column + 1)]
+
+    def load_tile(self, tile):
+        if tile in self.pending:
+            return
+        level = tile[0]
+        task = TileTask(self.path, (self.generation,) + tile, self.level_size(level), self.tile_rect(*tile),
+                        self.signals)
+        task.setAutoDelete(False)
+        self.pending[tile] = task
+        self.thread_pool.start(task)
+
+    def paintEvent(self, event):
+        if self.path is None or self.image_size.isEmpty() or self.width() == 0:
+            return
+
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        level = self.level()
+
+        # tiles scrolled out of the viewport are not decoded
+        visible = self.visible_tiles(self.visibleRegion().boundingRect(), level)
+        for tile, task in list(self.pending.items()):
+            if tile not in visible and tile[0] != self.max_level() and self.thread_pool.tryTake(task):
+                del self.pending[tile]
+
+        for tile in self.visible_tiles(event.rect(), level):
+            pixmap = self.tile(tile)
+            if pixmap is not None:
+                self.draw_tile(painter, tile, pixmap)
+            else:
+                self.load_tile(tile)
+                self.draw_coarser_tile(painter, tile)
+
+    def tile(self, tile):
+        """return a decoded tile or None"""
+        if tile in self.overview:
+            return self.overview[tile]
+        if tile in self.tiles:
+            self.tiles.move_to_end(tile)
+            return self.tiles[tile]
+        return None
+
+    def draw_tile(self, painter, tile, pixmap, source=None):
+        """draw a tile or a part of it
+
+        Args:
+            painter (QPainter): painter
+            tile (tuple): (level, column, row)
+            pixmap (QPixmap): tile
+            source (QRectF): part of the tile to draw in tile coordinates, the whole tile if None
+        """
+        level = tile[0]
+        ratio = self.scale() * 2 ** level
+        rect = QRectF(self.tile_rect(*tile))
+        if source is None:
+            source = QRectF(0, 0, pixmap.width(), pixmap.height())
+        target = QRectF((rect.x() + source.x()) * ratio, (rect.y() + source.y()) * ratio,
+                        source.width() * ratio, source.height() * ratio)
+        painter.drawPixmap(target, pixmap, source)
+
+    def draw_coarser_tile(self, painter, tile):
+        """draw the part of an already decoded coarser tile while a tile is decoded"""
+        level, column, row = tile
+        rect = QRectF(self.tile_rect(*tile))
+        for coarser_level in range(level + 1, self.max_level() + 1):
+            factor = 2 ** (coarser_level - level)
+            coarser = (coarser_level, column // factor, row // factor)
+            pixmap = self.tile(coarser)
+            if pixmap is not None:
+                coarser_rect = QRectF(self.tile_rect(*coarser))
+                source = QRectF(rect.x() / factor - coarser_rect.x(), rect.y() / factor - coarser_rect.y(),
+                                rect.width() / factor, rect.height() / factor)
+                self.draw_tile(painter, coarser, pixmap, source)
+                return
+
+    @Slot(object, QImage)
+    def on_tile_loaded(self, key, image):
+        generation, tile = key[0], key[1:]
+        if generation != self.generation:
+            return
+        self.pending.pop(tile, None)
+        if image.isNull():
+            return
+
+        pixmap = QPixmap.fromImage(image)
+        if tile[0] == self.max_level():
+            self.overview[tile] = pixmap
+            self.update()
+            return
+        self.tiles[tile] = pixmap
+        self.bytes += pixmap.width() * pixmap.height() * 4
+        while self.bytes > self.max_bytes and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.bytes -= evicted.width() * evicted.height() * 4
+
+        ratio = self.scale() * 2 ** tile[0]
+        rect = self.tile_rect(*tile)
+        self.update(QRect(int(rect.x() * ratio), int(rect.y() * ratio),
+                          math.ceil(rect.width() * ratio) + 1, math.ceil(rect.height() * ratio) + 1))
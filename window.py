@@ -1,35 +1,112 @@
 import os
-import glob
-import shutil
 
-from optparse import OptionParser
-from PySide6.QtCore import QEvent, QPoint, QSettings, Qt
-from PySide6.QtGui import QAction, QIcon, QImageReader, QMovie, QPixmap, QTransform
+from PySide6.QtCore import QEvent, QPoint, QSettings, QSize, Qt, QTimer, Signal
+from PySide6.QtGui import QAction, QActionGroup, QIcon, QImage, QImageReader, QPixmap, QTransform
 from PySide6.QtWidgets import (QDialog, QDockWidget, QFileDialog, QLabel, QMainWindow,
                                QMenu, QMessageBox, QScrollArea, QWidget)
+from animation_player import AnimationPlayer
+from catalog import Catalog, MetadataScanner
+from directory_scanner import DirectoryScanner, TreeScanner, image_extensions, scan_directory
+from exif import MATRIX_ORIENTATIONS, ORIENTATION_MATRICES, read_exif
+from file_operations import COPY, DELETE, MOVE, OVERWRITE, RENAME, SKIP, FileOperations
+from folder_watcher import FolderWatcher
 from image_dialog import ImageDialog
+from image_canvas import ImageCanvas
 from image_gallery import ImageGallery
+from tiled_image import TiledImage, too_large
+from image_loader import ANIMATED, STILL, TILED, ImageLoader
+from image_saver import ImageSaver
+from instance_messages import GOTO, LIBRARY, NEXT, OPEN, PREVIOUS
+from profiler import Stopwatch, profiler
+from similar_images import SimilarImages
+from sort_order import DATE, MODIFIED, NATURAL, ORDERS, SIZE, BackgroundSorter, ImageSorter, natural_key
 
 
 class Window(QMainWindow):
+    image_shown = Signal(str)  # path of the image painted, as a reduced preview or decoded
+    images_listed = Signal(int)  # number of images of the folder listed
+
     def __init__(self):
         QMainWindow.__init__(self)
 
         self.images = []
+        self.image_indexes = {}  # path -> index in images
         self.index = -1
-        self.ratio = 1  # ratio for QLabel image
+        self.ratio = 1  # ratio for the image canvas
+        self.pixmap = None  # full resolution pixmap of a still image
+        self.image_size = QSize()  # size of the displayed image, once oriented
+        self.orientation = QTransform()  # rotation and flips of a still image, applied while painting
+        self.preview = None  # path of the image whose reduced preview is displayed
+        self.display_error = None  # status message of the displayed image that cannot be decoded
+        self.display_stopwatch = None  # times the display of the current image while profiling
+        self.timings = {}  # event -> duration in ms of its last record, shown in the status bar
         self.mouse_position = None
         self.settings = None
 
         # Extensions
-        self.extensions = []
-        for format in QImageReader.supportedImageFormats():
-            self.extensions.append(format.data().decode('utf-8'))
-
-        # Filters
-        self.filters = []
-        for extension in self.extensions:
-            self.filters.append('*.{0}'.format(str(extension)))
+        self.image_extensions = image_extensions()
+
+        # background decoding
+        self.image_loader = ImageLoader(self)
+        self.image_loader.image_loaded.connect(self.on_image_loaded)
+        self.image_loader.preview_loaded.connect(self.on_preview_loaded)
+
+        # rotations saved in background
+        self.image_saver = ImageSaver(self)
+        self.image_saver.saved.connect(self.on_image_saved)
+        self.image_saver.failed.connect(self.on_image_save_failed)
+
+        # copy, move and delete in background
+        self.file_operations = FileOperations(self)
+        self.file_operations.progress.connect(self.on_file_operation_progress)
+        self.file_operations.finished.connect(self.on_file_operation_finished)
+        self.file_operations.conflicts_checked.connect(self.on_conflicts_checked)
+
+        # near-duplicate finder
+        self.similar_images = SimilarImages(self)
+        self.similar_images.progress.connect(self.on_similar_images_progress)
+        self.similar_images.finished.connect(self.on_similar_images_found)
+
+        # commands of the other instances, run in batches
+        self.messages = []
+        self.message_timer = QTimer(self)
+        self.message_timer.setSingleShot(True)
+        self.message_timer.setInterval(50)
+        self.message_timer.timeout.connect(self.run_messages)
+
+        # high quality rescale once a window resize is over
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(150)
+        self.resize_timer.timeout.connect(self.resize_finished)
+
+        # folder of the opened file, listed once the file is displayed
+        self.folder_listing = None  # ScanResult waiting for the displayed image
+        self.directory_scanner = DirectoryScanner(self)
+        self.directory_scanner.scanned.connect(self.on_directory_scanned)
+
+        # listings and metadata of the folders opened before, refreshed in background
+        self.catalog = Catalog()
+        self.metadata = {}  # path -> FileInfo of the listed images
+        self.metadata_scanner = MetadataScanner(self.catalog, self)
+        self.metadata_scanner.updated.connect(self.on_metadata_updated)
+
+        # the folder sorted in each order used, new files are inserted in place
+        self.sort_order = NATURAL
+        self.image_sorter = ImageSorter()
+        self.background_sorter = BackgroundSorter(self)
+        self.background_sorter.sorted.connect(self.on_images_sorted)
+
+        # watch the folder for files added or removed by other programs
+        self.folder_watcher = FolderWatcher(self.image_extensions, self, catalog=self.catalog)
+        self.folder_watcher.directory_changed.connect(self.on_directory_changed)
+
+        # directory tree browsed as one list, walked in background
+        self.library = None  # root of the tree, None while browsing the folder of the opened file
+        self.opened_files = None  # files browsed instead of their folder, as several files opened at once
+        self.tree_scanner = TreeScanner(self)
+        self.tree_scanner.found.connect(self.on_tree_found)
+        self.tree_scanner.finished.connect(self.on_tree_scanned)
 
         # UI
         self.set_up_ui()
@@ -38,29 +115,96 @@ class Window(QMainWindow):
         self.load_settings()
 
     def on_message_received(self, msg):
-        """ on message received from single application
+        """ on message received from single application, messages received together are run in one batch
 
         Args:
-            msg (string): file path
+            msg (dict): command and its arguments
         """
-        self.create_images(msg)
-        self.display_image()
+        self.messages.append(msg)
+        if not self.message_timer.isActive():
+            self.message_timer.start()
+
+    def run_messages(self, messages=None):
+        """run a batch of commands, the folder is listed once for all the files opened
+
+        The first file of the last open command is displayed, with the other files of the command as the
+        image list if there are several, then the navigation commands received after it are applied.
+
+        Args:
+            messages (list): commands, the messages received if None
+        """
+        if messages is None:
+            messages, self.messages = self.messages, []
+        path = None
+        paths = []
+        library = None
+        moves = []  # navigation commands received after the last file or tree opened
+        for msg in messages:
+            command = msg.get('command')
+            if command == OPEN:
+                files = [file for file in msg.get('paths', []) if isinstance(file, str) and os.path.isfile(file)]
+                if files:
+                    path, paths = files[0], files
+                    library = None
+                    moves = []
+            elif command == LIBRARY:
+                if isinstance(msg.get('path'), str) and os.path.isdir(msg['path']):
+                    library = msg['path']
+                    path = None
+                    moves = []
+            elif command in (NEXT, PREVIOUS, GOTO):
+                moves.append(msg)
+
+        if library is not None:
+            # the tree is not walked yet, there is nothing to move to
+            self.open_library(library)
+            return
+        if len(paths) > 1:
+            self.open_files(paths)
+        elif path is not None:
+            if path in self.image_indexes:
+                self.index = self.image_indexes[path]
+            else:
+                self.create_images(path, wait=bool(moves))
+        if self.index == -1:
+            return
+
+        index = self.index
+        for msg in moves:
+            if msg['command'] == NEXT:
+                index += 1
+            elif msg['command'] == PREVIOUS:
+                index -= 1
+            elif isinstance(msg.get('index'), int):
+                index = msg['index']
+            index = max(0, min(index, len(self.images) - 1))
+        if path is not None or index != self.index:
+            self.index = index
+            self.ratio = 1.0
+            self.display_image()
 
     def set_up_ui(self):
         # Status Bar
         self.status_bar = self.statusBar()
         self.label_name = QLabel()
         self.label_numero = QLabel()
+        self.label_timings = QLabel()
         self.status_bar.addPermanentWidget(self.label_name, 1)
+        self.status_bar.addPermanentWidget(self.label_timings, 0)
         self.status_bar.addPermanentWidget(self.label_numero, 0)
+        self.label_timings.setVisible(profiler.enabled)
+        profiler.recorded.connect(self.on_profiler_recorded)
 
         # Main Window
         self.setWindowTitle('BaloViewer')
         self.setWindowIcon(QIcon('baloviewer.ico'))
 
-        # Label image
-        self.image = QLabel()
-        self.image.setScaledContents(True)
+        # image canvas
+        self.image = ImageCanvas()
+
+        # view of the images too large to be decoded at once
+        self.tiled_image = TiledImage()
+        self.view = self.image  # widget of the scroll area
 
         # Scroll area
         self.scroll_area = QScrollArea()
@@ -72,7 +216,7 @@ class Window(QMainWindow):
 
         # image list
         self.image_gallery = ImageGallery(self)
-        self.image_gallery.itemClicked.connect(self.image_gallery_clicked)
+        self.image_gallery.clicked.connect(self.image_gallery_clicked)
         self.image_gallery.viewport().installEventFilter(self)
         self.dock_widget = QDockWidget('Image Gallery', self)
         self.dock_widget.setWidget(self.image_gallery)
@@ -87,15 +231,6 @@ class Window(QMainWindow):
         self.create_menubar()
         self.create_toolbar()
 
-        # option parser
-        parser = OptionParser()
-        parser.add_option("-f", "--file", dest="filename", help="open a file")
-        (options, args) = parser.parse_args()
-        parser_file = options.filename
-        if parser_file is not None and os.path.isfile(parser_file):
-            self.create_images(parser_file)
-            self.display_image()
-
     def create_actions(self):
         # Action Open
         self.action_open = QAction(QIcon.fromTheme('document-open'), 'Open', self)
@@ -103,6 +238,18 @@ class Window(QMainWindow):
         self.action_open.setStatusTip('Open file')
         self.action_open.triggered.connect(self.open)
 
+        # Action Open folder tree
+        self.action_open_library = QAction(QIcon.fromTheme('folder-open'), 'Open folder tree', self)
+        self.action_open_library.setShortcut('Ctrl+Shift+O')
+        self.action_open_library.setStatusTip('Browse the images of a folder and of its subfolders')
+        self.action_open_library.triggered.connect(self.open_library_dialog)
+
+        # Action Stop scanning
+        self.action_stop_scan = QAction(QIcon.fromTheme('process-stop'), 'Stop scanning', self)
+        self.action_stop_scan.setStatusTip('Stop looking for images in the subfolders')
+        self.action_stop_scan.setEnabled(False)
+        self.action_stop_scan.triggered.connect(self.stop_scan)
+
         # Action Save
         self.action_save = QAction(QIcon.fromTheme('document-save'), 'Save', self)
         self.action_save.setShortcut('Ctrl+S')
@@ -205,6 +352,29 @@ class Window(QMainWindow):
         self.action_image_gallery.setCheckable(True)
         self.action_image_gallery.triggered.connect(self.image_gallery_triggered)
 
+        # Action Similar images
+        self.action_similar_images = QAction('Similar images', self)
+        self.action_similar_images.setStatusTip('List only the near-duplicate images, grouped')
+        self.action_similar_images.setCheckable(True)
+        self.action_similar_images.triggered.connect(self.similar_images_triggered)
+
+        # Actions Sort by
+        self.sort_actions = QActionGroup(self)
+        for order, text in ((NATURAL, 'Name'), (MODIFIED, 'Date modified'), (DATE, 'Date taken'), (SIZE, 'Size')):
+            action = QAction(text, self.sort_actions)
+            action.setStatusTip('Sort the images by ' + text.lower())
+            action.setCheckable(True)
+            action.setData(order)
+        self.sort_actions.triggered.connect(self.sort_triggered)
+
+        # Action Timings
+        self.action_timings = QAction('Timings', self)
+        self.action_timings.setStatusTip('Show the timings of the last image displayed, while profiling')
+        self.action_timings.setCheckable(True)
+        self.action_timings.setChecked(profiler.enabled)
+        self.action_timings.setVisible(profiler.enabled)
+        self.action_timings.triggered.connect(self.label_timings.setVisible)
+
         # Action Next_image
         self.action_next_image = QAction(QIcon.fromTheme('go-next'), 'Next image', self)
         self.action_next_image.setStatusTip('Next image')
@@ -231,6 +401,8 @@ class Window(QMainWindow):
         # File
         self.menu_file = self.menubar.addMenu('File')
         self.menu_file.addAction(self.action_open)
+        self.menu_file.addAction(self.action_open_library)
+        self.menu_file.addAction(self.action_stop_scan)
         self.menu_file.addAction(self.action_save)
         self.menu_file.addSeparator()
         self.menu_file.addAction(self.action_copy)
@@ -260,6 +432,10 @@ class Window(QMainWindow):
         self.menu_view.addAction(self.action_fit_horizontal)
         self.menu_view.addSeparator()
         self.menu_view.addAction(self.action_image_gallery)
+        self.menu_view.addAction(self.action_similar_images)
+        self.menu_sort = self.menu_view.addMenu('Sort by')
+        self.menu_sort.addActions(self.sort_actions.actions())
+        self.menu_view.addAction(self.action_timings)
 
         # Go
         self.menu_go = self.menubar.addMenu('Go')
@@ -303,6 +479,15 @@ class Window(QMainWindow):
         self.action_image_gallery.setChecked(check_state)
         self.image_gallery_triggered()
 
+        sort_order = self.settings.value('view/sort_order', NATURAL, type=str)
+        self.sort_order = sort_order if sort_order in ORDERS else NATURAL
+        for action in self.sort_actions.actions():
+            action.setChecked(action.data() == self.sort_order)
+
+        # decoded image cache budget in MB
+        cache_size = self.settings.value('cache/image_cache_size', 512, type=int)
+        self.image_loader.cache.set_max_bytes(cache_size * 1024 * 1024)
+
     def contextMenuEvent(self, QContextMenuEvent):
         menu = QMenu()
         menu.addAction(self.action_fullscreen)
@@ -381,93 +566,531 @@ class Window(QMainWindow):
         self.scroll_area.horizontalScrollBar().setValue(self.scroll_area.horizontalScrollBar().value() - diff.x())
 
     def resizeEvent(self, event):
-        if not self.index == -1:
-            self.display_image()
+        """rescale the decoded image, the file is not read again
 
-    def create_images(self, filename):
+        While the window is resized the canvas paints with a fast transformation, a smooth one is
+        painted once the resize is over.
+        """
+        super(Window, self).resizeEvent(event)
+        if self.index == -1 or self.image_size.isEmpty():
+            return
+
+        self.image.set_fast_transform(True)
+        self.resize_timer.start()
+
+        # keep the same part of the image at the center of the viewport
+        scroll_bars = (self.scroll_area.horizontalScrollBar(), self.scroll_area.verticalScrollBar())
+        centers = [(bar.value() + bar.pageStep() / 2) / (bar.maximum() + bar.pageStep()) for bar in scroll_bars]
+        self.resize_image()
+        for bar, center in zip(scroll_bars, centers):
+            bar.setValue(int(center * (bar.maximum() + bar.pageStep()) - bar.pageStep() / 2))
+
+    def resize_finished(self):
+        self.image.set_fast_transform(False)
+
+    def changeEvent(self, event):
+        """pause the animation while the window is minimized"""
+        super(Window, self).changeEvent(event)
+        if event.type() == QEvent.WindowStateChange and self.image.animation:
+            if self.isMinimized():
+                self.image.animation.pause()
+            else:
+                self.image.animation.start()
+
+    def create_images(self, filename, wait=False):
         """Create image list
 
+        The file is listed alone and can be displayed at once, the folder is listed in background and
+        replaces the list once the file is displayed.
+
         Args:
             filename (string): file from which to retrieve the list of images in the folder
+            wait (boolean): list the folder before returning
         """
 
-        self.images.clear()
+        self.similar_images.cancel()
+        self.action_similar_images.setChecked(False)
+        self.tree_scanner.cancel()
+        self.library = None
+        self.opened_files = None
+        self.action_stop_scan.setEnabled(False)
+
         # get images only with an allowed extension
-        for ext in self.extensions:
-            self.images += glob.glob(os.path.join(glob.escape(os.path.dirname(filename)), '*.' +
-                                                  ''.join('[%s%s]' % (e.lower(), e.upper()) for e in ext)))
+        self.images = [filename] if os.path.splitext(filename)[1].lower() in self.image_extensions else []
+        self.image_indexes = {path: index for index, path in enumerate(self.images)}
+        self.image_loader.clear()
+        self.index = 0 if self.images else -1
+        self.image_gallery.add_images(self.images)
 
-        self.images.sort()
-        if filename in self.images:
-            self.index = self.images.index(filename)
+        self.metadata_scanner.cancel()
+        self.metadata = {}
+        self.image_gallery.set_metadata(self.metadata)
+        self.image_sorter.clear()
+        self.background_sorter.cancel()
+
+        directory = os.path.dirname(filename)
+        self.folder_listing = None
+        if wait:
+            self.directory_scanner.cancel()
+            self.on_directory_scanned(scan_directory(directory, self.image_extensions, self.catalog))
         else:
-            self.index = -1
+            self.directory_scanner.scan(directory, self.image_extensions, self.catalog)
+        self.folder_watcher.watch(directory)
+
+    def open_files(self, paths):
+        """browse several files as the image list instead of the folder of the first one
+
+        The files are listed in the sort order, the folders are neither listed nor watched.
+
+        Args:
+            paths (list): file paths, the first one is displayed
+        """
+        images = [path for path in dict.fromkeys(paths) if os.path.splitext(path)[1].lower() in self.image_extensions]
+        if len(images) < 2 or paths[0] not in images:
+            self.create_images(paths[0])
+            return
+
+        self.similar_images.cancel()
+        self.action_similar_images.setChecked(False)
+        self.tree_scanner.cancel()
+        self.library = None
+        self.action_stop_scan.setEnabled(False)
+        self.directory_scanner.cancel()
+        self.folder_listing = None
+        self.folder_watcher.stop()
+        self.metadata_scanner.cancel()
+        self.metadata = {}
+        self.image_gallery.set_metadata(self.metadata)
+        self.image_sorter.clear()
+        self.background_sorter.cancel()
+
+        self.opened_files = images
+        self.image_loader.clear()
+        self.image_sorter.set_images(sorted(images, key=natural_key))
+        order = self.listed_order()
+        self.images = list(self.image_sorter.images(order))
+        self.image_indexes = dict(self.image_sorter.indexes(order))
+        self.image_gallery.add_images(self.images, rows=self.image_indexes)
+        self.index = self.image_indexes[paths[0]]
+        self.images_listed.emit(len(self.images))
+
+    def on_directory_scanned(self, result):
+        """ on folder of the opened file listed by the directory scanner
+
+        Args:
+            result (ScanResult): images of the folder
+        """
+        self.folder_listing = result
+        if self.index == -1 or self.images[self.index] not in self.image_loader.pending:
+            self.list_folder()
+
+    def list_folder(self):
+        """replace the image list by the folder listing, the displayed image is kept"""
+        if self.folder_listing is None:
+            return
+        result, self.folder_listing = self.folder_listing, None
+        current = self.images[self.index] if not self.index == -1 else None
+        # the metadata stored in the catalog sorts the folder without reading the files
+        self.metadata.update(result.metadata)
+        self.image_gallery.update_metadata(result.metadata)
+        self.image_sorter.set_images(result.images)
+        if current is not None and current not in result.indexes:
+            # a file the listing skips, as a hidden file
+            self.image_sorter.add([current], self.metadata)
+        order = self.listed_order()
+        self.images = list(self.image_sorter.images(order))
+        self.image_indexes = dict(self.image_sorter.indexes(order))
+        self.status_bar.showMessage('{0} images listed in {1:.0f} ms'.format(len(self.images),
+                                                                             result.elapsed * 1000), 5000)
 
         # iamge list
-        self.image_gallery.add_images(self.images)
+        self.image_gallery.add_images(self.images, rows=self.image_indexes)
+        self.metadata_scanner.refresh(result)
+        if current is not None:
+            self.index = self.image_indexes[current]
+            self.label_numero.setText(str(self.index + 1) + ' / ' + str(len(self.images)))
+            self.image_gallery.select_row(self.index)
+            self.image_loader.prefetch(self.images, self.index)
+        self.images_listed.emit(len(self.images))
+
+    def on_directory_changed(self, result):
+        """patch the image list and the gallery with the files added or removed in the folder
+
+        Args:
+            result (ScanResult): new content of the folder
+        """
+        if self.directory_scanner.scanning or self.folder_listing is not None:
+            # newer than the listing of the opened file
+            self.directory_scanner.cancel()
+            self.on_directory_scanned(result)
+            return
+        self.metadata_scanner.refresh(result)
+        if self.action_similar_images.isChecked():
+            # the list is made of the groups of similar images, only the removed files are dropped
+            self.remove_images(path for path in self.images if path not in result.indexes)
+            return
+        removed_paths = [path for path in self.images if path not in result.indexes]
+        added_paths = [path for path in result.images if path not in self.image_indexes]
+        if not removed_paths and not added_paths:
+            return
+        removed = [self.image_indexes[path] for path in removed_paths]
+        # placed by binary search in the sorted list, the folder is not sorted again
+        self.image_sorter.remove(removed_paths, self.metadata)
+        self.image_sorter.add(added_paths, self.metadata)
+        order = self.listed_order()
+        images = list(self.image_sorter.images(order))
+        indexes = dict(self.image_sorter.indexes(order))
+        self.update_images(images, indexes, removed, sorted((indexes[path], path) for path in added_paths))
+
+    def on_metadata_updated(self, metadata):
+        """ on metadata of the listed images read from the catalog or from the files
 
-    def remove_index(self):
-        """ remove file from list images and display next or previous image
+        Args:
+            metadata (dict): path -> FileInfo
         """
+        self.metadata.update(metadata)
+        self.image_gallery.update_metadata(metadata)
+        if self.sort_order in self.image_sorter.update(metadata) and not self.action_similar_images.isChecked():
+            # files changed since they were sorted
+            self.show_sorted_images()
 
-        del self.images[self.index]
-        self.image_gallery.remove_row(self.index)
+    def sort_triggered(self, action):
+        """sort the images in the order of the action, the displayed image is kept
 
-        if len(self.images) == 0:
-            self.images.clear()
-            self.index = -1
-            self.image.clear()
-            self.image.resize(self.image.minimumSizeHint())
-        elif self.index < len(self.images) - 1:
-            self.display_image()
+        Args:
+            action (QAction): sort action, its data is the order
+        """
+        self.sort_order = action.data()
+        self.settings.setValue('view/sort_order', self.sort_order)
+        if not self.action_similar_images.isChecked():
+            # the groups of similar images keep their order, the folder is sorted once listed again
+            self.show_sorted_images()
+
+    def listed_order(self):
+        """return the sort order if its list is kept, else NATURAL while the images are sorted in background
+
+        A directory tree is sorted once it is walked.
+        """
+        if self.image_sorter.images(self.sort_order) is not None:
+            return self.sort_order
+        if not self.tree_scanner.scanning:
+            self.background_sorter.sort(self.sort_order, self.image_sorter, self.metadata)
+        return NATURAL
+
+    def on_images_sorted(self, order, images, keys, indexes, version):
+        """ on images sorted by the background sorter
+
+        Args:
+            order (string): order of the images
+            images (list): images sorted in this order
+            keys (dict): path -> key of the images
+            indexes (dict): path -> index in images
+            version (int): version of the image sorter the images were taken from
+        """
+        if not self.image_sorter.set_sorted(order, images, keys, version, indexes):
+            if order == self.sort_order:
+                # the images changed meanwhile, the keys already computed are kept
+                self.listed_order()
+            return
+        if order == self.sort_order and not self.action_similar_images.isChecked():
+            self.show_sorted_images()
+
+    def show_sorted_images(self):
+        """list the folder in the sort order, an order already used is not sorted again"""
+        if self.folder_listing is not None or not self.image_sorter.lists[NATURAL]:
+            # sorted once listed
+            return
+        order = self.listed_order()
+        images = self.image_sorter.images(order)
+        if images == self.images:
+            # still in natural order, sorted in background
+            return
+        current = self.images[self.index] if not self.index == -1 else None
+        self.images = list(images)
+        self.image_indexes = dict(self.image_sorter.indexes(order))
+        self.image_gallery.add_images(self.images, rows=self.image_indexes)
+        if current in self.image_indexes:
+            self.index = self.image_indexes[current]
+            self.label_numero.setText(str(self.index + 1) + ' / ' + str(len(self.images)))
+            self.image_gallery.select_row(self.index)
+            self.image_loader.prefetch(self.images, self.index)
+
+    def remove_images(self, paths):
+        """remove files from the image list and the gallery in one batch
+
+        Args:
+            paths (iterable): image paths
+        """
+        paths = set(paths)
+        self.image_sorter.remove(paths, self.metadata)
+        removed = [index for index, path in enumerate(self.images) if path in paths]
+        images = [path for path in self.images if path not in paths]
+        self.update_images(images, {path: index for index, path in enumerate(images)}, removed, [])
+
+    def update_images(self, images, indexes, removed, added):
+        """replace the image list, the gallery is patched and the displayed image kept if it is still listed
+
+        Args:
+            images (list): new list of image path
+            indexes (dict): path -> index in images
+            removed (list): indexes of the removed images in the previous list
+            added (list): (index, path) of the added images, sorted by index
+        """
+        if not removed and not added:
+            return
+
+        current = self.images[self.index] if not self.index == -1 else None
+        self.image_gallery.remove_rows(removed)
+        self.image_gallery.insert_rows(added)
+        self.images = images
+        self.image_indexes = indexes
+
+        if current is None:
+            return
+        if current in self.image_indexes:
+            self.index = self.image_indexes[current]
+            self.label_numero.setText(str(self.index + 1) + ' / ' + str(len(self.images)))
+            self.image_gallery.select_row(self.index)
+        elif len(self.images) == 0:
+            self.clear_image()
         else:
-            self.index = len(self.images) - 1
+            # the displayed image has been removed, display the one now at its place
+            self.index = min(self.index - sum(1 for index in removed if index < self.index), len(self.images) - 1)
             self.display_image()
 
+    def set_view(self, view):
+        """set the widget displaying the image in the scroll area
+
+        Args:
+            view (QWidget): image label or tiled image
+        """
+        if self.scroll_area.widget() is not view:
+            self.scroll_area.takeWidget()
+            self.scroll_area.setWidget(view)
+        self.view = view
+
+    def clear_image(self):
+        self.index = -1
+        self.pixmap = None
+        self.image_size = QSize()
+        self.image.clear()
+        self.tiled_image.clear()
+        self.set_view(self.image)
+        self.image.resize(0, 0)
+
     def display_image(self):
         if not self.index == -1:
+            self.pixmap = None
+            self.preview = None
+            self.image_size = QSize()
+            if self.display_error is not None and self.status_bar.currentMessage() == self.display_error:
+                self.status_bar.clearMessage()
+            self.display_error = None
+            self.resize_timer.stop()
             self.image.clear()
-            self.image.resize(self.image.minimumSizeHint())
+            self.tiled_image.clear()
+            self.set_view(self.image)
+            self.image.resize(0, 0)
+            if profiler.enabled:
+                self.display_stopwatch = Stopwatch()
+                # timings of the previous image
+                self.timings = {key: value for key, value in self.timings.items() if key == 'thumbnail'}
 
             file = self.images[self.index]
             if os.path.isfile(file):
+                self.orientation = self.file_orientation(file)
                 self.label_name.setText(file)
                 self.label_numero.setText(str(self.index + 1) + ' / ' + str(len(self.images)))
 
                 # image list
                 self.image_gallery.select_row(self.index)
 
-                image_reader = QImageReader(file)
-                if image_reader.imageCount() > 1:
-                    # Animated image
-                    movie = QMovie(file)
-                    movie.setCacheMode(QMovie.CacheAll)
-                    movie.jumpToFrame(0)
-                    movie_size = movie.currentPixmap().size()
-                    self.image.setMovie(movie)
-                    self.image.resize(movie_size)
-                    movie.start()
+                # decoded image or decode it in background
+                loaded = self.image_loader.image(file)
+                if self.display_stopwatch:
+                    self.display_stopwatch.fields['cached'] = loaded is not None
+                if loaded:
+                    self.show_image(file, *loaded)
                 else:
-                    self.image.setPixmap(QPixmap(file))
-                    self.image.resize(self.image.pixmap().size())
+                    # gallery thumbnail at once, then a reduced decode, then the full image
+                    thumbnail = self.image_gallery.cached_thumbnail(file)
+                    if thumbnail:
+                        # thumbnails are upright, the preview is oriented like the decoded image
+                        thumbnail = thumbnail.transformed(self.orientation.inverted()[0])
+                        info = self.metadata.get(file)
+                        if info and info.width is not None:
+                            image_size = QSize(info.width, info.height)
+                        else:
+                            image_size = QImageReader(file).size()
+                        self.show_preview(file, thumbnail, image_size)
+                    self.image_loader.load_preview(file, self.scroll_area.viewport().size())
+                    self.image_loader.load(file)
+                self.image_loader.prefetch(self.images, self.index)
+
+    def on_preview_loaded(self, file, image, image_size):
+        """ on reduced decode of an image by the image loader
 
-                # fit image
-                if self.action_fit_screen.isChecked():
-                    self.fit_screen()
-                elif self.action_fit_horizontal.isChecked():
-                    self.fit_width()
-                elif self.action_fit_vertical.isChecked():
-                    self.fit_height()
+        Args:
+            file (string): image path
+            image (QImage): reduced image
+            image_size (QSize): full size of the image
+        """
+        if not self.index == -1 and self.images[self.index] == file:
+            self.show_preview(file, QPixmap.fromImage(image), image_size)
 
-                else:
-                    self.ratio = 1.0
+    def show_preview(self, file, pixmap, image_size):
+        """paint a reduced image stretched to the geometry of the full image
+
+        The full image then replaces it without any change of zoom or scroll position.
+
+        Args:
+            file (string): image path
+            pixmap (QPixmap): reduced image
+            image_size (QSize): full size of the image
+        """
+        if self.pixmap or self.image.animation or self.view is not self.image or not image_size.isValid():
+            # the full image is already displayed
+            return
+
+        self.image.set_pixmap(pixmap)
+        self.image.set_orientation(self.orientation)
+        if self.preview != file:
+            if self.display_stopwatch:
+                self.display_stopwatch.lap('preview')
+            self.preview = file
+            self.image_size = self.oriented_size(image_size)
+            self.view.resize(self.image_size)
+            self.fit_image()
+        self.image_shown.emit(file)
+
+    def on_image_loaded(self, file, image, kind):
+        """ on image decoded by the image loader
+
+        Args:
+            file (string): image path
+            image (QImage): decoded image, null for an animated or tiled image
+            kind (int): STILL, ANIMATED or TILED
+        """
+        if not self.index == -1 and self.images[self.index] == file:
+            self.show_image(file, image, kind)
+        if self.folder_listing is not None:
+            # the gallery is filled once the image is painted
+            QTimer.singleShot(0, self.list_folder)
+
+    def show_image(self, file, image, kind):
+        """paint a decoded image
+
+        Args:
+            file (string): image path
+            image (QImage): decoded image, null for an animated or tiled image
+            kind (int): STILL, ANIMATED or TILED
+        """
+        if self.display_stopwatch:
+            self.display_stopwatch.lap('wait')
+        if self.preview == file and kind == STILL and self.oriented_size(image.size()) == self.image_size:
+            # replace the preview, the geometry is already the one of the image
+            self.preview = None
+            self.pixmap = QPixmap.fromImage(image)
+            self.image.set_pixmap(self.pixmap, image, file)
+            self.image.set_orientation(self.orientation)
+            self.record_display(file, kind)
+            self.image_shown.emit(file)
+            return
+
+        self.preview = None
+        if kind == ANIMATED:
+            animation = AnimationPlayer(file, self.image)
+            self.pixmap = None
+            self.orientation = QTransform()
+            self.image_size = animation.size()
+            self.image.set_animation(animation)
+            self.set_view(self.image)
+            if self.isMinimized():
+                animation.pause()
+        elif kind == TILED:
+            self.pixmap = None
+            self.orientation = QTransform()
+            self.image_size = QImageReader(file).size()
+            self.set_view(self.tiled_image)
+            self.tiled_image.set_source(file, self.image_size)
+        elif image.isNull():
+            # not decoded, as an image over the allocation limit in a format that cannot be tiled
+            self.pixmap = None
+            self.image_size = QSize()
+            self.set_view(self.image)
+            reason = 'the image is too large' if too_large(QImageReader(file)) else 'the image cannot be decoded'
+            self.display_error = '{0} cannot be displayed: {1}'.format(os.path.basename(file), reason)
+            self.status_bar.showMessage(self.display_error)
+            self.record_display(file, kind)
+            return
+        else:
+            self.pixmap = QPixmap.fromImage(image)
+            self.image_size = self.oriented_size(self.pixmap.size())
+            self.image.set_pixmap(self.pixmap, image, file)
+            self.image.set_orientation(self.orientation)
+            self.set_view(self.image)
+        self.view.resize(self.image_size)
+        self.fit_image()
+        self.record_display(file, kind)
+        self.image_shown.emit(file)
+
+    def record_display(self, file, kind):
+        """record the display of an image, from its request to its upload and layout, while profiling
+
+        Args:
+            file (string): image path
+            kind (int): STILL, ANIMATED or TILED
+        """
+        if not self.display_stopwatch:
+            return
+        self.display_stopwatch.lap('show')
+        fields = self.display_stopwatch.total()
+        self.display_stopwatch = None
+        profiler.record('display', file, kind=kind, image_cache_hit_rate=self.image_loader.cache.stats()['hit_rate'],
+                        thumbnail_hit_rate=self.image_gallery.hit_rate(), **fields)
+
+    def on_profiler_recorded(self, record):
+        """ on timings recorded by the profiler, the ones of the displayed image and of the last thumbnail
+        are shown in the status bar
+
+        Args:
+            record (dict): event, path and durations
+        """
+        if record['event'] != 'thumbnail' and (self.index == -1 or record['path'] != self.images[self.index]):
+            # prefetched image
+            return
+        self.timings[record['event']] = record['total_ms']
+        if record['event'] == 'display':
+            self.timings['cache'] = record['image_cache_hit_rate']
+            self.timings['thumbnails'] = record['thumbnail_hit_rate']
+        texts = []
+        for event in ('display', 'decode', 'preview', 'scale', 'paint', 'thumbnail'):
+            if event in self.timings:
+                texts.append('{0} {1:.0f} ms'.format(event, self.timings[event]))
+        for cache in ('cache', 'thumbnails'):
+            if cache in self.timings:
+                texts.append('{0} {1:.0%}'.format(cache, self.timings[cache]))
+        self.label_timings.setText(' | '.join(texts))
+
+    def fit_image(self):
+        """apply the fit mode to a new image and scroll to its top left corner"""
+        # fit image
+        if self.action_fit_screen.isChecked():
+            self.fit_screen()
+        elif self.action_fit_horizontal.isChecked():
+            self.fit_width()
+        elif self.action_fit_vertical.isChecked():
+            self.fit_height()
 
-                self.action_zoom_in.setEnabled(True)
-                self.action_zoom_out.setEnabled(True)
+        else:
+            self.ratio = 1.0
 
-                # scrollbar position
-                self.scroll_area.verticalScrollBar().setSliderPosition(0)
-                self.scroll_area.horizontalScrollBar().setSliderPosition(0)
+        self.action_zoom_in.setEnabled(True)
+        self.action_zoom_out.setEnabled(True)
+
+        # scrollbar position
+        self.scroll_area.verticalScrollBar().setSliderPosition(0)
+        self.scroll_area.horizontalScrollBar().setSliderPosition(0)
 
     def resize_image(self):
         if self.action_fit_screen.isChecked():
@@ -476,18 +1099,15 @@ class Window(QMainWindow):
             self.fit_width()
         elif self.action_fit_vertical.isChecked():
             self.fit_height()
-        elif self.image.pixmap():
-            self.image.resize(self.ratio * self.image.pixmap().size())
-        elif movie := self.image.movie():
-            movie.jumpToFrame(0)
-            movie_size = movie.currentPixmap().size()
-            self.image.resize(self.ratio * movie_size)
+        elif not self.image_size.isEmpty():
+            self.view.resize(self.ratio * self.image_size)
 
     def open(self):
         """Open a file
         """
         filename, filtr = QFileDialog.getOpenFileName(
-            self, 'Open file', os.path.expanduser('~'), "Images ({0});;All files (*)".format((' '.join(self.filters)))
+            self, 'Open file', os.path.expanduser('~'), "Images ({0});;All files (*)".format(
+                ' '.join('*' + extension for extension in sorted(self.image_extensions)))
         )
         if filename:
             try:
@@ -496,10 +1116,131 @@ class Window(QMainWindow):
             except Exception as e:
                 self.message_box_error('Error', 'The file cannot be opened', e)
 
+    def open_library_dialog(self):
+        """Open a folder tree
+        """
+        directory = QFileDialog.getExistingDirectory(self, 'Open folder tree', self.library or os.path.expanduser('~'))
+        if directory:
+            self.open_library(directory)
+
+    def open_library(self, directory):
+        """browse the images of a directory and of its subdirectories as one list
+
+        The tree is walked in background, the first images found are displayed at once and the next
+        ones are appended to the list and to the gallery as they are found.
+
+        Args:
+            directory (string): root of the tree
+        """
+        self.similar_images.cancel()
+        self.action_similar_images.setChecked(False)
+        self.directory_scanner.cancel()
+        self.folder_listing = None
+        self.folder_watcher.stop()
+        self.metadata_scanner.cancel()
+        self.metadata = {}
+        self.image_gallery.set_metadata(self.metadata)
+        self.image_sorter.clear()
+        self.background_sorter.cancel()
+
+        self.library = directory
+        self.opened_files = None
+        self.image_loader.clear()
+        self.clear_image()
+        self.images = []
+        self.image_indexes = {}
+        self.image_gallery.add_images(self.images)
+        self.label_name.setText(directory)
+        self.label_numero.clear()
+        self.action_stop_scan.setEnabled(True)
+        self.status_bar.showMessage('Looking for images in {0}...'.format(directory))
+        self.tree_scanner.scan(directory, self.image_extensions)
+
+    def on_tree_found(self, images):
+        """ on images found by the tree scanner, appended to the list
+
+        Args:
+            images (list): image paths, in natural order after the ones found before
+        """
+        self.image_sorter.extend(images)
+        if self.action_similar_images.isChecked():
+            # the list is made of the groups of similar images
+            return
+        self.image_indexes.update((path, index) for index, path in enumerate(images, len(self.images)))
+        self.images.extend(images)
+        self.image_gallery.append_rows(images)
+        self.status_bar.showMessage('Looking for images in {0}: {1} found'.format(self.library, len(self.images)))
+        if self.index == -1:
+            # the first image is displayed while the tree is walked
+            self.index = 0
+            self.ratio = 1.0
+            self.display_image()
+        else:
+            self.label_numero.setText(str(self.index + 1) + ' / ' + str(len(self.images)))
+
+    def on_tree_scanned(self, images, elapsed):
+        """ on directory tree walked by the tree scanner, it is sorted in background in the sort order
+
+        Args:
+            images (list): all the images of the tree, in natural order
+            elapsed (float): duration of the walk in seconds
+        """
+        self.action_stop_scan.setEnabled(False)
+        self.status_bar.showMessage('{0} images found in {1:.1f} s'.format(len(images), elapsed), 5000)
+        if not self.action_similar_images.isChecked():
+            self.show_sorted_images()
+        self.images_listed.emit(len(images))
+
+    def stop_scan(self):
+        """stop walking the tree, the images found so far stay listed"""
+        if not self.tree_scanner.scanning:
+            return
+        self.tree_scanner.cancel()
+        self.action_stop_scan.setEnabled(False)
+        self.status_bar.showMessage('{0} images found, search stopped'.format(len(self.images)), 5000)
+        if not self.action_similar_images.isChecked():
+            self.show_sorted_images()
+
     def save(self):
-        if not self.index == -1:
-            if not self.image.pixmap().save(self.images[self.index]):
-                self.message_box_error('Error', 'This file cannot be saved')
+        """save the rotations and flips of the image in background
+
+        A JPEG file gets the orientation in its Exif block and keeps its compressed pixels. Other
+        files are written again in their format, which needs no resampling.
+        """
+        if self.index == -1:
+            return
+        file = self.images[self.index]
+        if not self.pixmap:
+            self.message_box_error('Error', 'This file cannot be saved')
+            return
+        orientation = MATRIX_ORIENTATIONS[self.matrix(self.orientation)]
+        # the decoded image is shared with the cache of the loader, the pixmap is not converted back
+        loaded = self.image_loader.image(file)
+        if self.image_saver.save(file, loaded[0] if loaded else QImage(), orientation):
+            self.status_bar.showMessage('Saving {0}...'.format(os.path.basename(file)))
+        else:
+            self.status_bar.showMessage('{0} is already being saved'.format(os.path.basename(file)), 3000)
+
+    def on_image_saved(self, file, image, orientation):
+        """ on image saved by the image saver
+
+        Args:
+            file (string): image path
+            image (QImage): pixels written, null if only the Exif orientation was written
+            orientation (int): Exif orientation that was saved
+        """
+        self.status_bar.showMessage('{0} saved'.format(os.path.basename(file)), 3000)
+        if not image.isNull() and self.pixmap and not self.index == -1 and self.images[self.index] == file:
+            # the orientation is now in the pixels, the rotations made since then are kept
+            saved = QTransform(*ORIENTATION_MATRICES[orientation], 0, 0)
+            self.orientation = saved.inverted()[0] * self.orientation
+            self.pixmap = QPixmap.fromImage(image)
+            self.image.set_pixmap(self.pixmap, image)
+            self.image.set_orientation(self.orientation)
+
+    def on_image_save_failed(self, file, error):
+        self.status_bar.clearMessage()
+        self.message_box_error('Error', '{0} cannot be saved'.format(os.path.basename(file)), error)
 
     def copy(self):
         self.move_copy_dialog(True)
@@ -507,94 +1248,170 @@ class Window(QMainWindow):
     def move(self):
         self.move_copy_dialog(False)
 
+    def selected_files(self):
+        """return the files selected in the gallery, the displayed one if none is selected"""
+        files = self.image_gallery.selected_paths()
+        if not files and not self.index == -1:
+            files = [self.images[self.index]]
+        return files
+
     def move_copy_dialog(self, copy):
-        """dialog for copy or move a file
+        """dialog for copy or move the selected files
 
         Args:
             copy (boolean): True to copy, False to move
         """
+        files = self.selected_files()
+        if not files:
+            return
 
         if copy:
-            libelle = "Move to"
-        else:
             libelle = "Copy to"
+        else:
+            libelle = "Move to"
 
-        if not self.index == -1:
-            directory = QFileDialog.getExistingDirectory(self, libelle, self.images[self.index],
-                                                         QFileDialog.ShowDirsOnly | QFileDialog.DontUseNativeDialog)
-            if directory:
-                file = os.path.join(directory, os.path.basename(self.images[self.index]))
-                if not os.path.isfile(file):
-                    self.move_copy_file(self.images[self.index], file, copy)
-                else:
-                    dialog = ImageDialog(self.images[self.index], file)
-                    result = dialog.exec_()
-                    if result == QDialog.Accepted:
-                        self.move_copy_file(self.images[self.index], file, copy)
-                    elif result == 3:
-                        # renamme
-                        self.move_copy_file(self.images[self.index],
-                                            os.path.join(directory, os.path.basename(dialog.edit_file_name.text())),
-                                            copy)
-
-    def move_copy_file(self, src, dst, copy):
-        """move or copy a file
+        directory = QFileDialog.getExistingDirectory(self, libelle, files[0],
+                                                     QFileDialog.ShowDirsOnly | QFileDialog.DontUseNativeDialog)
+        if not directory:
+            return
+
+        operation = COPY if copy else MOVE
+        self.file_operations.check_conflicts(
+            operation, [(file, os.path.join(directory, os.path.basename(file))) for file in files])
+
+    def on_conflicts_checked(self, operation, files, conflicts):
+        """ on destination files compared with the files to copy or move
+
+        The files whose destination has the same content are not asked about: they are skipped by a copy,
+        a move only removes them.
 
         Args:
-            src (string): source image
-            dst (string): destination image
-            copy (boolean): True to copy, False to move
+            operation (int): COPY or MOVE
+            files (list): (src, dst)
+            conflicts (list): (src, dst) whose destination exists with another content
         """
-        try:
-            if copy:
-                shutil.copy(src, dst)
-            else:
-                shutil.move(src, dst)
-                self.remove_index()
-        except Exception as e:
-            if copy:
-                self.message_box_error('This file cannot be moved', e)
-            else:
-                self.message_box_error('This file cannot be copied', e)
+        policy = OVERWRITE
+        if len(files) == 1 and conflicts:
+            # a single file is compared with the one it would replace
+            src, dst = files[0]
+            dialog = ImageDialog(src, dst)
+            result = dialog.exec_()
+            if result == 3:
+                # renamme
+                files = [(src, os.path.join(os.path.dirname(dst), os.path.basename(dialog.edit_file_name.text())))]
+            elif result != QDialog.Accepted:
+                return
+        elif conflicts:
+            policy = self.conflict_policy(len(conflicts))
+            if policy is None:
+                return
+        self.start_file_operation(operation, files, policy)
+
+    def conflict_policy(self, count):
+        """ask once what to do with the files that already exist in the destination folder
+
+        Args:
+            count (int): number of files that already exist
+
+        Returns:
+            int: OVERWRITE, SKIP or RENAME, None to cancel
+        """
+        message = QMessageBox(self)
+        message.setIcon(QMessageBox.Question)
+        message.setWindowTitle('Files already exist')
+        message.setText('{0} files already exist in this folder.'.format(count))
+        buttons = {message.addButton('Overwrite', QMessageBox.AcceptRole): OVERWRITE,
+                   message.addButton('Skip', QMessageBox.AcceptRole): SKIP,
+                   message.addButton('Keep both', QMessageBox.AcceptRole): RENAME}
+        message.addButton(QMessageBox.Cancel)
+        message.exec_()
+        return buttons.get(message.clickedButton())
 
     def delete(self):
-        if not self.index == -1:
-            if os.path.isfile(self.images[self.index]):
-                reply = QMessageBox.critical(self, 'Delete file', 'Are you sure you want to delete this file ?',
-                                             QMessageBox.Yes, QMessageBox.No)
-                if reply == QMessageBox.Yes:
-                    try:
-                        if movie := self.image.movie():
-                            movie.stop()
-                        os.remove(self.images[self.index])
-                    except Exception as e:
-                        self.message_box_error('Error', 'This file cannot be deleted', e)
-                    else:
-                        self.remove_index()
-            else:
-                self.remove_index()
+        files = self.selected_files()
+        if not files:
+            return
+        if len(files) == 1:
+            text = 'Are you sure you want to delete this file ?'
+        else:
+            text = 'Are you sure you want to delete these {0} files ?'.format(len(files))
+        reply = QMessageBox.critical(self, 'Delete file', text, QMessageBox.Yes, QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            self.start_file_operation(DELETE, [(file, None) for file in files])
 
-    def rotate_left(self):
-        if self.image.pixmap():
-            self.image.setPixmap(self.image.pixmap().transformed(QTransform().rotate(270),
-                                                                 Qt.SmoothTransformation))
+    def start_file_operation(self, operation, files, policy=OVERWRITE):
+        """copy, move or delete files in background
+
+        Args:
+            operation (int): COPY, MOVE or DELETE
+            files (list): (src, dst), dst is None for a deletion
+            policy (int): OVERWRITE, SKIP or RENAME when a destination file exists
+        """
+        if operation != COPY and not self.index == -1 and self.images[self.index] in dict(files):
+            if animation := self.image.animation:
+                animation.stop()
+        self.file_operations.start(operation, files, policy)
+
+    def on_file_operation_progress(self, operation, done, total):
+        names = {COPY: 'Copying', MOVE: 'Moving', DELETE: 'Deleting'}
+        self.status_bar.showMessage('{0} {1} / {2}'.format(names[operation], done, total))
+
+    def on_file_operation_finished(self, result):
+        """ on batch of files copied, moved or deleted
+
+        Args:
+            result (FileOperationResult): files done, skipped and failed
+        """
+        name = {COPY: 'copied', MOVE: 'moved', DELETE: 'deleted'}[result.operation]
+        if result.operation != COPY:
+            self.remove_images(src for src, dst in result.done)
+        message = '{0} files {1}'.format(len(result.done), name)
+        if result.skipped:
+            message += ', {0} skipped'.format(len(result.skipped))
+        self.status_bar.showMessage(message, 5000)
+        if result.errors:
+            self.message_box_error('Error', '{0} files cannot be {1}'.format(len(result.errors), name),
+                                   '\n'.join('{0}: {1}'.format(src, error) for src, error in result.errors))
+
+    @staticmethod
+    def file_orientation(file):
+        """return the transform of the Exif orientation of a file, identity if it has none"""
+        exif = read_exif(file)
+        return QTransform(*ORIENTATION_MATRICES[exif.orientation if exif else 1], 0, 0)
+
+    @staticmethod
+    def matrix(transform):
+        return (round(transform.m11()), round(transform.m12()), round(transform.m21()), round(transform.m22()))
+
+    def oriented_size(self, size):
+        """return the size of the image once the orientation is applied"""
+        if self.orientation.m11() == 0:
+            return size.transposed()
+        return QSize(size)
+
+    def orient(self, transform):
+        """rotate or flip the still image while painting it, the pixels are not touched
+
+        Args:
+            transform (QTransform): rotation by a multiple of 90 degrees or flip
+        """
+        if self.pixmap:
+            self.orientation = self.orientation * transform
+            self.image_size = self.oriented_size(self.pixmap.size())
+            self.image.set_orientation(self.orientation)
             self.resize_image()
 
+    def rotate_left(self):
+        self.orient(QTransform(*ORIENTATION_MATRICES[8], 0, 0))
+
     def rotate_right(self):
-        if self.image.pixmap():
-            self.image.setPixmap(self.image.pixmap().transformed(QTransform().rotate(90),
-                                                                 Qt.SmoothTransformation))
-            self.resize_image()
+        self.orient(QTransform(*ORIENTATION_MATRICES[6], 0, 0))
 
     def flip_horizontal(self):
-        if self.image.pixmap():
-            self.image.setPixmap(self.image.pixmap().fromImage(self.image.pixmap().toImage().mirrored(True, False)))
-            self.resize_image()
+        self.orient(QTransform(*ORIENTATION_MATRICES[2], 0, 0))
 
     def flip_vertical(self):
-        if self.image.pixmap():
-            self.image.setPixmap(self.image.pixmap().fromImage(self.image.pixmap().toImage().mirrored()))
-            self.resize_image
+        self.orient(QTransform(*ORIENTATION_MATRICES[4], 0, 0))
 
     def fullscreen(self):
         if self.isFullScreen():
@@ -622,7 +1439,7 @@ class Window(QMainWindow):
 
     def normal_size(self):
         if not self.index == -1:
-            self.image.adjustSize()
+            self.view.resize(self.image_size)
             self.ratio = 1.0
             self.action_fit_vertical.setChecked(False)
             self.action_fit_horizontal.setChecked(False)
@@ -632,15 +1449,13 @@ class Window(QMainWindow):
 
     def fit_screen(self):
         if not self.index == -1:
-            self.image.adjustSize()
+            if self.image_size.isEmpty():
+                # not decoded yet, the fit is applied when the image is displayed
+                return
+            self.view.resize(self.image_size)
             self.ratio = 1.0
-            if self.image.pixmap():
-                width = self.image.width()
-                height = self.image.height()
-            elif movie := self.image.movie():
-                movie.jumpToFrame(0)
-                width = self.image.width()
-                height = self.image.height()
+            width = self.image_size.width()
+            height = self.image_size.height()
 
             if self.action_fit_screen.isChecked():
                 self.action_fit_horizontal.setChecked(False)
@@ -669,12 +1484,7 @@ class Window(QMainWindow):
     def scale_image(self, ratio):
         if not self.index == -1:
             self.ratio *= ratio
-            if self.image.pixmap():
-                self.image.resize(self.ratio * self.image.pixmap().size())
-            elif movie := self.image.movie():
-                movie.jumpToFrame(0)
-                movie_size = movie.currentPixmap().size()
-                self.image.resize(self.ratio * movie_size)
+            self.view.resize(self.ratio * self.image_size)
 
             self.adjust_scrollbar(self.scroll_area.horizontalScrollBar(), ratio)
             self.adjust_scrollbar(self.scroll_area.verticalScrollBar(), ratio)
@@ -682,7 +1492,7 @@ class Window(QMainWindow):
             self.action_zoom_in.setEnabled(self.ratio < 3.0)
             self.action_zoom_out.setEnabled(self.ratio > 0.333)
 
-            self.image.repaint()
+            self.view.repaint()
 
     def zoom_in(self):
         self.scale_image(1.20)
@@ -692,15 +1502,13 @@ class Window(QMainWindow):
 
     def fit_height(self):
         if not self.index == -1:
-            self.image.adjustSize()
+            if self.image_size.isEmpty():
+                # not decoded yet, the fit is applied when the image is displayed
+                return
+            self.view.resize(self.image_size)
             self.ratio = 1.0
-            if self.image.pixmap():
-                width = self.image.width()
-                height = self.image.height()
-            elif movie := self.image.movie():
-                movie.jumpToFrame(0)
-                width = self.image.width()
-                height = self.image.height()
+            width = self.image_size.width()
+            height = self.image_size.height()
 
             if self.action_fit_vertical.isChecked():
                 self.action_fit_horizontal.setChecked(False)
@@ -719,15 +1527,13 @@ class Window(QMainWindow):
 
     def fit_width(self):
         if not self.index == -1:
-            self.image.adjustSize()
+            if self.image_size.isEmpty():
+                # not decoded yet, the fit is applied when the image is displayed
+                return
+            self.view.resize(self.image_size)
             self.ratio = 1.0
-            if self.image.pixmap():
-                width = self.image.pixmap().width()
-                height = self.image.pixmap().height()
-            elif movie := self.image.movie():
-                movie.jumpToFrame(0)
-                width = movie.currentPixmap().width()
-                height = movie.currentPixmap().height()
+            width = self.image_size.width()
+            height = self.image_size.height()
 
             if self.action_fit_horizontal.isChecked():
                 self.action_fit_vertical.setChecked(False)
@@ -791,6 +1597,50 @@ class Window(QMainWindow):
             message.setDetailedText(str(error))
         message.exec_()
 
-    def image_gallery_clicked(self, item):
-        self.index = self.image_gallery.row(item)
+    def similar_images_triggered(self):
+        """list only the groups of near-duplicate images, or the whole folder again"""
+        if self.action_similar_images.isChecked():
+            if not self.images:
+                self.action_similar_images.setChecked(False)
+                return
+            self.similar_images.find(self.images)
+            self.status_bar.showMessage('Looking for similar images...')
+        else:
+            self.similar_images.cancel()
+            self.status_bar.clearMessage()
+            if self.library is not None or self.opened_files is not None:
+                # the tree is not walked again, the files opened together stay listed
+                self.show_sorted_images()
+                self.display_image()
+            elif not self.index == -1:
+                self.create_images(self.images[self.index])
+                self.display_image()
+
+    def on_similar_images_progress(self, done, total):
+        self.status_bar.showMessage('Looking for similar images: {0} / {1} hashed'.format(done, total))
+
+    def on_similar_images_found(self, groups):
+        """ on near-duplicates grouped by the similar image finder
+
+        Args:
+            groups (list): groups of similar image paths
+        """
+        if not self.action_similar_images.isChecked():
+            return
+        if not groups:
+            self.action_similar_images.setChecked(False)
+            self.status_bar.showMessage('No similar images', 5000)
+            return
+
+        current = self.images[self.index] if not self.index == -1 else None
+        self.images = [path for group in groups for path in group]
+        self.image_indexes = {path: index for index, path in enumerate(self.images)}
+        self.image_gallery.add_images(self.images, {path: number for number, group in enumerate(groups)
+                                                    for path in group})
+        self.index = self.image_indexes.get(current, 0)
+        self.display_image()
+        self.status_bar.showMessage('{0} similar images in {1} groups'.format(len(self.images), len(groups)), 5000)
+
+    def image_gallery_clicked(self, model_index):
+        self.index = model_index.row()
         self.display_image()